@@ -0,0 +1,379 @@
+"""Offline benchmarks for the music cog.
+
+    python -m benchmarks.bench                      # run everything, print a table
+    python -m benchmarks.bench --only play_next,queue_ops
+    python -m benchmarks.bench --save baseline.json
+    python -m benchmarks.bench --compare baseline.json --tolerance 0.25
+
+Each scenario drives the real cog code against the stand-ins in
+benchmarks/fakes.py. Latencies come from a timed pass; allocations from a
+second, shorter pass under tracemalloc (which would distort the timings).
+With --compare, the run exits with status 1 if any scenario got slower or
+allocates more than the tolerance allows.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fakes import FakeContext, FakeYoutubeDL, fake_ffmpeg, music_cog, video_id
+
+SCENARIOS = {}
+
+
+def scenario(name, count):
+    """Registers `async fn(cog, count, options) -> (latencies, extra)` under name."""
+    def register(fn):
+        SCENARIOS[name] = (fn, count)
+        return fn
+    return register
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def watch_url(i, salt=''):
+    return f"https://www.youtube.com/watch?v={video_id(f'{salt}{i}')}"
+
+
+# --- Scenarios ---
+
+@scenario('format_selection', 2000)
+async def bench_format_selection(cog, count, options):
+    """extract_stream_info() on recorded payloads: format filtering and sorting only."""
+    from utils.resolver import extract_stream_info
+
+    source = FakeYoutubeDL()
+    payloads = [source.extract_info(watch_url(i)) for i in range(count)]
+
+    class Replay:
+        def extract_info(self, url, download=False, **kwargs):
+            return payloads.pop()
+
+    replay = Replay()
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        extract_stream_info(replay, watch_url(i))
+        latencies.append(time.perf_counter() - started)
+    return latencies, {}
+
+
+@scenario('from_url', 300)
+async def bench_from_url(cog, count, options):
+    """YTDLSource.from_url() for video links: scheduler, extraction, caching and source setup."""
+    from cogs.music import YTDLSource
+
+    ytdl = cog.ytdl_yt = FakeYoutubeDL(cog.yt_opts, delay=options.delay)
+    latencies = []
+    with fake_ffmpeg(sys.modules['cogs.music']):
+        for i in range(count):
+            started = time.perf_counter()
+            await YTDLSource.from_url(watch_url(i, 'from_url'), loop=cog.bot.loop, ytdl_instance=ytdl,
+                                      cache=cog.track_cache, scheduler=cog.scheduler, audio_cache=cog.audio_cache)
+            latencies.append(time.perf_counter() - started)
+    return latencies, {'extract_calls_per_op': ytdl.calls / count}
+
+
+@scenario('resolve_search', 300)
+async def bench_resolve_search(cog, count, options):
+    """YTDLSource.resolve() for search terms, the path every Spotify and playlist track takes."""
+    from cogs.music import YTDLSource
+
+    ytdl = cog.ytdl_yt = FakeYoutubeDL(cog.yt_opts, delay=options.delay)
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        await YTDLSource.resolve(f"ytsearch:artist {i} - song {i}", loop=cog.bot.loop, ytdl_instance=ytdl,
+                                 cache=cog.track_cache, scheduler=cog.scheduler, audio_cache=cog.audio_cache)
+        latencies.append(time.perf_counter() - started)
+    return latencies, {'extract_calls_per_op': ytdl.calls / count}
+
+
+@scenario('player_embed', 5000)
+async def bench_player_embed(cog, count, options):
+    """create_player_embed() plus the to_dict() the renderer compares."""
+    from cogs.music import YTDLSource
+    from utils.resolver import extract_stream_info
+
+    loop = asyncio.get_running_loop()
+    ctx = FakeContext(loop, 1)
+    data = extract_stream_info(FakeYoutubeDL(), watch_url(0))
+    with fake_ffmpeg(sys.modules['cogs.music']):
+        source = YTDLSource.from_resolved(data, volume=0.5)
+    player = cog.get_player(ctx.guild.id)
+    for i in range(50):
+        player.queue.append((f"artist {i} - a rather long song title number {i} (official video)", 1))
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        cog.create_player_embed(source, ctx).to_dict()
+        latencies.append(time.perf_counter() - started)
+    return latencies, {}
+
+
+@scenario('queue_ops', 3000)
+async def bench_queue_ops(cog, count, options):
+    """Adding, skipping and viewing on a long queue (one op = append, appendleft, 2x popleft, !queue)."""
+    import cogs.music as music
+
+    loop = asyncio.get_running_loop()
+    ctx = FakeContext(loop, 1, keep_log=False)
+    player = cog.get_player(ctx.guild.id)
+    player.queue.extend((watch_url(i, 'queue'), i % 7) for i in range(options.queue_size))
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        player.queue.append((watch_url(i, 'append'), 1))
+        player.queue.appendleft((watch_url(i, 'front'), 1))
+        player.queue.popleft()
+        player.queue.popleft()
+        await music.Music.queue_info.callback(cog, ctx)
+        latencies.append(time.perf_counter() - started)
+    return latencies, {'queue_size': len(player.queue)}
+
+
+@scenario('queue_edit', 2000)
+async def bench_queue_edit(cog, count, options):
+    """!queue remove, !queue move and a !queue page at random positions of a long queue."""
+    import cogs.music as music
+
+    loop = asyncio.get_running_loop()
+    ctx = FakeContext(loop, 1, keep_log=False)
+    player = cog.get_player(ctx.guild.id)
+    player.queue.extend((watch_url(i, 'queue'), i % 7) for i in range(options.queue_size))
+    rng = random.Random(options.seed)
+    Music = music.Music
+    latencies = []
+    for i in range(count):
+        size = len(player.queue)
+        started = time.perf_counter()
+        await Music.queue_move.callback(cog, ctx, rng.randint(2, size), rng.randint(2, size))
+        await Music.queue_remove.callback(cog, ctx, rng.randint(2, size))
+        player.queue.append((watch_url(i, 'edit'), 1))
+        await Music.queue_info.callback(cog, ctx, rng.randint(1, size // music.QUEUE_PAGE_SIZE))
+        latencies.append(time.perf_counter() - started)
+    player.invalidate_prefetch()
+    return latencies, {'queue_size': len(player.queue)}
+
+
+@scenario('shuffle_picks', 3000)
+async def bench_shuffle_picks(cog, count, options):
+    """Shuffle mode on a long queue: one op = picking the next song and taking it off the queue."""
+    player = cog.get_player(1)
+    player.queue.extend((watch_url(i, 'queue'), i % 7) for i in range(options.queue_size + count))
+    player.is_shuffling = True
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        player.pick_next()
+        player.queue.popleft()
+        latencies.append(time.perf_counter() - started)
+    return latencies, {'queue_size': len(player.queue)}
+
+
+@scenario('playlist_commands', 300)
+async def bench_playlist_commands(cog, count, options):
+    """create, add 10 songs, show a page of a large playlist, remove, delete."""
+    import cogs.music as music
+
+    loop = asyncio.get_running_loop()
+    ctx = FakeContext(loop, 1, keep_log=False)
+    Music = music.Music
+    await Music.pl_create.callback(cog, ctx, 'big')
+    songs = [f"artist {i} - song {i}" for i in range(options.queue_size)]
+    for i in range(0, len(songs), 100):
+        await Music.pl_add.callback(cog, ctx, 'big', song_query=', '.join(songs[i:i + 100]))
+    pages = max(1, options.queue_size // music.PLAYLIST_PAGE_SIZE)
+    latencies = []
+    for i in range(count):
+        name = f'bench {i}'
+        started = time.perf_counter()
+        await Music.pl_create.callback(cog, ctx, name)
+        await Music.pl_add.callback(cog, ctx, name, song_query=', '.join(songs[i:i + 10]))
+        await Music.pl_show.callback(cog, ctx, 'big', page=i % pages + 1)
+        await Music.pl_remove_song.callback(cog, ctx, name, 1)
+        await Music.pl_delete.callback(cog, ctx, name)
+        latencies.append(time.perf_counter() - started)
+    return latencies, {}
+
+
+@scenario('play_next', 30)
+async def bench_play_next(cog, count, options):
+    """A queue of search terms played to the end; latency is time to first audio per track.
+
+    For the first track that is from play_next() being called, for the
+    rest from the previous track ending (the gap a listener hears).
+    """
+    import cogs.music as music
+
+    loop = asyncio.get_running_loop()
+    ctx = FakeContext(loop, 1)
+    ytdl = cog.ytdl_yt = FakeYoutubeDL(cog.yt_opts, delay=options.delay)
+    player = cog.get_player(ctx.guild.id)
+    for i in range(count):
+        player.queue.append((f"artist {i} - song {i}", 1))
+    voice = ctx.voice_client
+    track_seconds = options.frames * 0.02
+    with fake_ffmpeg(music, frames=options.frames, startup=options.startup):
+        started = time.perf_counter()
+        await cog.play_next(ctx)
+        deadline = started + count * (track_seconds + options.delay * 4 + options.startup + 1) + 5
+        while (len(voice.finished) < count or player.current_song) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+    if len(voice.first_frame) < count:
+        raise RuntimeError(f"only {len(voice.first_frame)}/{count} tracks started")
+    latencies = [voice.first_frame[0] - started]
+    latencies += [first - ended for first, ended in zip(voice.first_frame[1:], voice.finished)]
+    return latencies, {
+        'underruns': voice.underruns,
+        'frames': voice.frames,
+        'extract_calls_per_op': ytdl.calls / count,
+        'channel_sends': ctx.channel.sends,
+        'channel_edits': ctx.channel.edits,
+    }
+
+
+# --- Runner ---
+
+async def run_scenario(name, options):
+    fn, default_count = SCENARIOS[name]
+    count = max(1, int(default_count * options.scale))
+    loop = asyncio.get_running_loop()
+    with contextlib.redirect_stdout(sys.stderr if options.verbose else open(os.devnull, 'w')):
+        async with music_cog(loop) as cog:
+            await fn(cog, max(1, count // 10), options)  # Warm-up
+        async with music_cog(loop) as cog:
+            latencies, extra = await fn(cog, count, options)
+        alloc_count = max(1, min(count, options.alloc_ops))
+        async with music_cog(loop) as cog:
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            await fn(cog, alloc_count, options)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return {
+        'ops': len(latencies),
+        # Scenarios run their ops one after another; setup time isn't counted
+        'ops_per_sec': len(latencies) / sum(latencies) if sum(latencies) else 0.0,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'alloc_peak_kib': (peak - before) / 1024,
+        'retained_bytes_per_op': (current - before) / alloc_count,
+        **extra,
+    }
+
+
+def print_table(results):
+    header = f"{'scenario':<20}{'ops':>7}{'ops/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KiB':>11}{'kept B/op':>11}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        print(f"{name:<20}{r['ops']:>7}{r['ops_per_sec']:>10.1f}{r['p50_ms']:>10.3f}{r['p90_ms']:>10.3f}"
+              f"{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}{r['alloc_peak_kib']:>11.1f}{r['retained_bytes_per_op']:>11.0f}")
+        extra = {k: v for k, v in r.items() if k not in _TABLE_KEYS}
+        if extra:
+            print('    ' + ', '.join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in extra.items()))
+
+
+_TABLE_KEYS = {'ops', 'ops_per_sec', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms',
+               'alloc_peak_kib', 'retained_bytes_per_op'}
+
+# Figures checked by --compare; larger is worse for all of them
+_COMPARED = ('p50_ms', 'p90_ms', 'alloc_peak_kib')
+
+
+def compare(results, baseline, tolerance):
+    """Returns a line for every compared figure that is worse than baseline by more than tolerance."""
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in _COMPARED:
+            old, new = base.get(key), r.get(key)
+            # Ignore noise on figures too small to matter
+            floor = 0.05 if key.endswith('_ms') else 16
+            if old is None or new is None or max(old, new) < floor:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(f"{name}.{key}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the music cog.")
+    parser.add_argument('--only', help="Comma-separated scenarios to run (default: all). Available: " + ', '.join(SCENARIOS))
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiplier for every scenario's op count.")
+    parser.add_argument('--delay', type=float, default=0.02, help="Seconds each fake extract_info() call takes.")
+    parser.add_argument('--frames', type=int, default=10, help="20 ms frames per fake track in play_next.")
+    parser.add_argument('--startup', type=float, default=0.0, help="Seconds before a fake track's first frame (ffmpeg start-up).")
+    parser.add_argument('--queue-size', type=int, default=2000, help="Queue/playlist length for the queue and playlist scenarios.")
+    parser.add_argument('--alloc-ops', type=int, default=200, help="Ops run under tracemalloc per scenario.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON instead of a table.")
+    parser.add_argument('--save', metavar='FILE', help="Write results to FILE for a later --compare.")
+    parser.add_argument('--compare', metavar='FILE', help="Fail if results are worse than FILE's.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown for --compare (0.25 = 25%%).")
+    parser.add_argument('--verbose', action='store_true', help="Show the cog's own log output.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    names = options.only.split(',') if options.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(unknown)}")
+    random.seed(options.seed)
+
+    async def run_all():
+        results = {}
+        for name in names:
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = await run_scenario(name, options)
+        return results
+
+    results = asyncio.run(run_all())
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {k: v for k, v in vars(options).items() if k not in ('save', 'compare', 'json', 'verbose')},
+        'results': results,
+    }
+    if options.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results)
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if options.compare:
+        with open(options.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, options.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS (tolerance {options.tolerance:.0%}):", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions against {options.compare}.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
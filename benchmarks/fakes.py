@@ -0,0 +1,380 @@
+"""Local stand-ins for YouTube, Discord voice and Discord channels.
+
+Nothing here touches the network or spawns ffmpeg, so the cog can be
+driven end to end on any machine and the numbers only move when the
+bot's own code does.
+"""
+import asyncio
+import contextlib
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import types
+
+import discord
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads')
+
+FRAME_SECONDS = 0.02  # Discord wants one 20 ms frame per tick
+PCM_FRAME = b'\0' * 3840
+OPUS_FRAME = b'\xfc\xff\xfe' + b'\0' * 157
+
+_SEARCH_RE = re.compile(r'^[a-z]+search(\d*):(.*)$', re.S)
+
+
+def load_payload(name):
+    """Loads a recorded extract_info() result from benchmarks/payloads/<name>.json."""
+    with open(os.path.join(PAYLOAD_DIR, f'{name}.json'), 'r') as f:
+        return json.load(f)
+
+
+def video_id(text):
+    """A stable, YouTube-shaped ID for any query, so every query is a distinct track."""
+    return hashlib.sha1(text.encode()).hexdigest()[:11]
+
+
+class FakeYoutubeDL:
+    """Answers extract_info() from a recorded payload after `delay` seconds.
+
+    Behaves like yt-dlp with extract_flat='in_playlist': searches and
+    playlists return flat entries (no formats), video pages return the full
+    payload with its ID, title and URLs rewritten for the requested video.
+    Any URL containing one of `failing` raises like a blocked video would.
+    `jitter` spreads each delay uniformly by that fraction either way.
+    """
+
+    def __init__(self, params=None, *, payload='youtube_video', delay=0.0, jitter=0.0, playlist_size=50, failing=(),
+                 watch_url='https://www.youtube.com/watch?v={}'):
+        self.params = params or {}
+        self.payload = load_payload(payload) if isinstance(payload, str) else payload
+        self.delay = delay
+        self.jitter = jitter
+        self.watch_url = watch_url
+        self.playlist_size = playlist_size
+        self.failing = tuple(failing)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _flat_entry(self, vid, title):
+        return {'_type': 'url', 'ie_key': 'Youtube', 'id': vid, 'title': title,
+                'url': self.watch_url.format(vid), 'duration': self.payload.get('duration')}
+
+    def _video(self, vid, title=None):
+        data = copy.deepcopy(self.payload)
+        old = data['id']
+        data['id'] = data['display_id'] = vid
+        data['title'] = data['fulltitle'] = title or f"{data['title']} [{vid}]"
+        for key in ('original_url', 'url'):
+            if data.get(key):
+                data[key] = data[key].replace(old, vid)
+        data['webpage_url'] = self.watch_url.format(vid)
+        for fmt in data.get('formats') or []:
+            fmt['url'] = fmt['url'].replace(old, vid)
+        return data
+
+    def extract_info(self, url, download=False, process=True, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay * random.uniform(1 - self.jitter, 1 + self.jitter) if self.jitter else self.delay)
+        if any(marker in url for marker in self.failing):
+            raise Exception(f"ERROR: [youtube] {url}: Sign in to confirm you're not a bot")
+        search = _SEARCH_RE.match(url)
+        if search:
+            count, query = int(search.group(1) or 1), search.group(2)
+            return {'_type': 'playlist', 'id': query, 'title': query,
+                    'entries': [self._flat_entry(video_id(f'{query}#{i}'), f'{query} #{i}') for i in range(count)]}
+        if 'list=' in url:
+            list_id = url.split('list=', 1)[1].split('&', 1)[0]
+            return {'_type': 'playlist', 'id': list_id, 'title': f'Playlist {list_id}',
+                    'entries': [self._flat_entry(video_id(f'{list_id}#{i}'), f'Track {i}')
+                                for i in range(self.playlist_size)]}
+        vid = url.split('v=', 1)[1].split('&', 1)[0] if 'v=' in url else video_id(url)
+        return self._video(vid)
+
+    def sanitize_info(self, info):
+        return info
+
+
+class FakeAudioSource(discord.AudioSource):
+    """A track of `frames` frames; the first read waits `startup` seconds like ffmpeg's probe."""
+
+    opus = False
+
+    def __init__(self, filename, *, frames=50, startup=0.0, **kwargs):
+        self.filename = filename
+        self.remaining = frames
+        self.startup = startup
+
+    def read(self):
+        if self.startup:
+            time.sleep(self.startup)
+            self.startup = 0.0
+        if self.remaining <= 0:
+            return b''
+        self.remaining -= 1
+        return OPUS_FRAME if self.opus else PCM_FRAME
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        self.remaining = 0
+
+
+@contextlib.contextmanager
+def fake_ffmpeg(music, *, frames=50, startup=0.0):
+    """Swaps the cog's ffmpeg-backed sources for FakeAudioSource while active."""
+
+    class FakePCM(FakeAudioSource):
+        def __init__(self, filename, **kwargs):
+            super().__init__(filename, frames=frames, startup=startup)
+
+    class FakeOpus(FakeAudioSource):
+        opus = True
+
+        def __init__(self, filename, *, data, **kwargs):
+            super().__init__(filename, frames=frames, startup=startup)
+            self.data = data
+            self.title = data.get('title')
+            self.url = data.get('url')
+            self.duration = data.get('duration')
+            self.is_live = data.get('is_live', False)
+
+    saved = (music.discord.FFmpegPCMAudio, music.YTDLOpusSource)
+    music.discord.FFmpegPCMAudio = FakePCM
+    music.YTDLOpusSource = FakeOpus
+    try:
+        yield
+    finally:
+        music.discord.FFmpegPCMAudio, music.YTDLOpusSource = saved
+
+
+def fake_downloads(audio_cache, *, delay=0.0, size=64 * 1024):
+    """Makes audio_cache.download() write a small placeholder file instead of calling yt-dlp."""
+    from utils.audio_cache import PARTIAL_DIR
+
+    def download(track_id, url, ytdl_options):
+        if delay:
+            time.sleep(delay)
+        partial_dir = os.path.join(audio_cache.directory, PARTIAL_DIR)
+        os.makedirs(partial_dir, exist_ok=True)
+        partial_path = os.path.join(partial_dir, f"{track_id.replace(':', '_')}.webm")
+        try:
+            with open(partial_path, 'wb') as f:
+                f.write(b'\0' * size)
+            return audio_cache._commit(track_id, partial_path)
+        finally:
+            with audio_cache._lock:
+                audio_cache._downloading.discard(track_id)
+
+    audio_cache.download = download
+
+
+class FakeVoiceClient:
+    """Plays sources the way discord.py's AudioPlayer does: one read() every 20 ms on a thread.
+
+    A frame that is ready later than its slot counts as an underrun.
+    Track start and end times are kept for gap and time-to-first-audio figures.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.source = None
+        self.started = []    # perf_counter() of each play() call
+        self.first_frame = []  # perf_counter() of each track's first frame
+        self.finished = []   # perf_counter() of each track's end
+        self.frames = 0
+        self.underruns = 0
+        self._playing = False
+        self._stop = threading.Event()
+        self._paused = False
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self._playing and not self._paused
+
+    def is_paused(self):
+        return self._paused
+
+    def play(self, source, *, after=None, **kwargs):
+        if self._playing:
+            raise discord.ClientException('Already playing audio.')
+        self.source = source
+        self._playing = True
+        self._stop = threading.Event()
+        self.started.append(time.perf_counter())
+        threading.Thread(target=self._run, args=(source, after, self._stop), name='fake-voice', daemon=True).start()
+
+    def _run(self, source, after, stop):
+        error = None
+        first = True
+        next_slot = time.perf_counter()
+        try:
+            while not stop.is_set():
+                if self._paused:
+                    time.sleep(FRAME_SECONDS)
+                    next_slot = time.perf_counter()
+                    continue
+                data = source.read()
+                now = time.perf_counter()
+                if not data:
+                    break
+                if first:
+                    self.first_frame.append(now)
+                    first = False
+                elif now > next_slot + FRAME_SECONDS:
+                    self.underruns += 1
+                    next_slot = now
+                self.frames += 1
+                next_slot += FRAME_SECONDS
+                delay = next_slot - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+        self.finished.append(time.perf_counter())
+        self._playing = False
+        if after is not None:
+            # discord.py calls `after` on its player thread; hop to the loop so
+            # the tasks it creates are picked up right away
+            self.loop.call_soon_threadsafe(after, error)
+
+    def stop(self):
+        self._stop.set()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def disconnect(self, **kwargs):
+        self.stop()
+
+
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, channel, content=None, embed=None, view=None):
+        FakeMessage._next_id += 1
+        self.id = FakeMessage._next_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+    async def edit(self, *, content=None, embed=None, view=None, **kwargs):
+        self.channel.edits += 1
+        self.channel.log.append(('edit', self.id, content))
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+
+    async def delete(self):
+        self.channel.deletes += 1
+        self.channel.log.append(('delete', self.id, None))
+
+
+class FakeChannel:
+    """Records what the bot sends and edits, optionally after an API round trip of `latency` seconds."""
+
+    def __init__(self, channel_id, guild=None, *, latency=0.0, keep_log=True):
+        self.id = channel_id
+        self.guild = guild
+        self.latency = latency
+        self.keep_log = keep_log
+        self.log = []
+        self.sends = 0
+        self.edits = 0
+        self.deletes = 0
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sends += 1
+        message = FakeMessage(self, content, embed, view)
+        if self.keep_log:
+            self.log.append(('send', message.id, content))
+        elif len(self.log) > 100:
+            del self.log[:50]
+        return message
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.members = {}
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+class FakeContext:
+    """Enough of commands.Context for the cog's commands and play loop."""
+
+    def __init__(self, loop, guild_id, *, author_id=1, channel_latency=0.0, keep_log=True):
+        self.guild = FakeGuild(guild_id)
+        self.channel = FakeChannel(guild_id, self.guild, latency=channel_latency, keep_log=keep_log)
+        self.voice_client = FakeVoiceClient(loop)
+        self.author = types.SimpleNamespace(id=author_id, voice=None, mention=f'<@{author_id}>')
+        self.guild.members[author_id] = self.author
+        self.interaction = None
+        self.prefix = '!'
+        self.command = None
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def defer(self, **kwargs):
+        pass
+
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+        self.user = types.SimpleNamespace(id=0)
+
+
+@contextlib.asynccontextmanager
+async def music_cog(loop):
+    """Builds a Music cog on fake Discord objects with its databases in a temporary directory.
+
+    cog_load() isn't run: the environment probe and metrics endpoint it
+    starts have nothing to do with the code being measured. Audio cache
+    downloads write placeholder files instead of fetching anything.
+    """
+    import cogs.music as music
+
+    with tempfile.TemporaryDirectory(prefix='musicbot-bench-') as tmp:
+        saved = (music.data_dir, music.cache_dir)
+        music.data_dir = tmp
+        music.cache_dir = os.path.join(tmp, 'music_cache')
+        os.makedirs(music.cache_dir)
+        try:
+            cog = music.Music(FakeBot(loop))
+        finally:
+            music.data_dir, music.cache_dir = saved
+        cog.ytdl_yt = FakeYoutubeDL(cog.yt_opts)
+        cog.ytdl_bili = FakeYoutubeDL(cog.bili_opts, watch_url='https://www.bilibili.com/video/BV{}')
+        fake_downloads(cog.audio_cache)
+        try:
+            yield cog
+        finally:
+            for player in cog.players.values():
+                player.invalidate_prefetch()
+                if player.render_task:
+                    player.render_task.cancel()
+            await cog.cog_unload()
@@ -0,0 +1,397 @@
+"""Many-guild load test for the music cog.
+
+    python -m benchmarks.loadtest --guilds 200 --duration 120
+    python -m benchmarks.loadtest --guilds 500 --rate 20 --duration 1800 --track-seconds 60   # soak
+    python -m benchmarks.loadtest --mix play=60,skip=30,queue=10
+
+One Music cog serves every simulated guild. Commands arrive as a Poisson
+process at --rate per second across all guilds, each going to a random
+guild and picked from --mix by weight; songs are drawn from a catalog with
+a few very popular tracks and a long tail, so the caches see realistic
+reuse. Each guild has a voice client reading 20 ms frames in real time.
+
+Reported: time to first audio per guild (from a play on an idle guild) and
+the gap between tracks, frame underruns, per-command latency, event loop
+lag and stalls, and memory (RSS, plus allocation growth by line with
+--tracemalloc) sampled every --report-every seconds.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.bench import percentile
+from benchmarks.fakes import FakeContext, FakeYoutubeDL, fake_ffmpeg, music_cog, video_id
+
+DEFAULT_MIX = ('play=40,skip=15,queue=10,queue_move=3,queue_remove=3,nowplaying=5,shuffle=4,loop=3,stop=4,'
+               'playlist_load=7,playlist_show=6,playlist_add=6')
+
+
+def rss_mb():
+    """Resident set size of this process in MiB."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        # Peak rather than current outside Linux, but still shows growth
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in COMMANDS:
+            raise ValueError(f"Unknown command '{name}' in mix. Available: {', '.join(COMMANDS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Guild:
+    """One simulated guild: its context plus what the load test measured there."""
+
+    def __init__(self, loop, guild_id, channel_latency):
+        self.id = guild_id
+        self.ctx = FakeContext(loop, guild_id, author_id=guild_id * 10, channel_latency=channel_latency, keep_log=False)
+        self.requests = []  # perf_counter() of plays issued while nothing was playing or loading
+
+    @property
+    def voice(self):
+        return self.ctx.voice_client
+
+
+class LoadTest:
+    def __init__(self, cog, options):
+        self.cog = cog
+        self.options = options
+        self.loop = asyncio.get_running_loop()
+        self.rng = random.Random(options.seed)
+        self.guilds = [Guild(self.loop, 1000 + i, options.channel_latency) for i in range(options.guilds)]
+        self.mix = parse_mix(options.mix)
+        self.catalog = self._catalog(options.catalog)
+        # Zipf-like popularity: a handful of hits and a long tail
+        self.catalog_weights = [1 / (rank + 1) ** 0.9 for rank in range(len(self.catalog))]
+        self.playlists = []
+        self.tasks = set()
+        self.command_latency = {name: [] for name in self.mix}
+        self.command_errors = {name: 0 for name in self.mix}
+        self.issued = 0
+        self.lag = []        # (time, lag) samples
+        self.samples = []    # periodic progress snapshots
+
+    def _catalog(self, size):
+        songs = []
+        for i in range(size):
+            if i % 10 < 7:
+                song = f"artist {i % 997} - song {i}"
+                if i % 100 < self.options.fail_percent:
+                    song += ' (blocked)'
+                songs.append(song)
+            else:
+                songs.append(f"https://www.youtube.com/watch?v={video_id(f'catalog{i}')}")
+        return songs
+
+    def position(self, guild):
+        return self.rng.randint(1, max(1, len(self.cog.get_player(guild.id).queue)))
+
+    def song(self):
+        return self.rng.choices(self.catalog, weights=self.catalog_weights)[0]
+
+    async def setup(self):
+        store = self.cog.playlists
+        for i in range(self.options.playlists):
+            name = f'load {i}'
+            size = self.rng.randint(20, self.options.playlist_size)
+            await self.loop.run_in_executor(None, store.create, name)
+            await self.loop.run_in_executor(None, store.append, name, [self.song() for _ in range(size)])
+            self.playlists.append(name)
+
+    # --- Commands ---
+
+    async def run_command(self, guild, name):
+        ctx = guild.ctx
+        player = self.cog.get_player(guild.id)
+        idle = not guild.voice.is_playing() and player.current_song is None
+        command, args, kwargs = COMMANDS[name](self, guild)
+        if name in ('play', 'playlist_load') and idle:
+            guild.requests.append(time.perf_counter())
+        ctx.command = command
+        started = time.perf_counter()
+        await self.cog.cog_before_invoke(ctx)
+        try:
+            await command.callback(self.cog, ctx, *args, **kwargs)
+        except Exception as e:
+            self.command_errors[name] += 1
+            if self.options.verbose:
+                print(f"Command {name} failed in guild {guild.id}: {e!r}", file=sys.stderr)
+        finally:
+            await self.cog.cog_after_invoke(ctx)
+        self.command_latency[name].append(time.perf_counter() - started)
+
+    def issue(self):
+        guild = self.rng.choice(self.guilds)
+        name = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        task = self.loop.create_task(self.run_command(guild, name), name=f'load:{name}:{guild.id}')
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        self.issued += 1
+
+    # --- Measurement ---
+
+    async def sample_lag(self, interval=0.05):
+        while True:
+            started = self.loop.time()
+            await asyncio.sleep(interval)
+            self.lag.append((time.perf_counter(), max(0.0, self.loop.time() - started - interval)))
+
+    def snapshot(self, since):
+        now = time.perf_counter()
+        recent_lag = [lag for at, lag in self.lag if at >= since]
+        players = self.cog.players.values()
+        sample = {
+            't': now - self.started,
+            'issued': self.issued,
+            'in_flight': len(self.tasks),
+            'playing': sum(1 for g in self.guilds if g.voice.is_playing()),
+            'queued': sum(len(p.queue) for p in players),
+            'extract_pending': self.cog.scheduler.pending(),
+            'underruns': sum(g.voice.underruns for g in self.guilds),
+            'lag_p99_ms': percentile(recent_lag, 0.99) * 1000,
+            'lag_max_ms': max(recent_lag, default=0.0) * 1000,
+            'rss_mb': rss_mb(),
+            'gc_objects': len(gc.get_objects()) if self.options.count_objects else None,
+        }
+        self.samples.append(sample)
+        print(f"[{sample['t']:7.1f}s] issued={sample['issued']} in_flight={sample['in_flight']} "
+              f"playing={sample['playing']}/{len(self.guilds)} queued={sample['queued']} "
+              f"extract_pending={sample['extract_pending']} underruns={sample['underruns']} "
+              f"lag p99={sample['lag_p99_ms']:.1f}ms max={sample['lag_max_ms']:.1f}ms rss={sample['rss_mb']:.1f}MiB",
+              file=sys.stderr)
+
+    async def run(self):
+        options = self.options
+        lag_task = self.loop.create_task(self.sample_lag())
+        self.cog.watchdog.start()
+        if options.tracemalloc:
+            tracemalloc.start(10)
+        self.started = time.perf_counter()
+        baseline = None
+        next_report = self.started + options.report_every
+        last_report = self.started
+        deadline = self.started + options.duration
+        try:
+            while (now := time.perf_counter()) < deadline:
+                self.issue()
+                await asyncio.sleep(self.rng.expovariate(options.rate))
+                if now >= next_report:
+                    self.snapshot(last_report)
+                    last_report, next_report = now, now + options.report_every
+                    if options.tracemalloc and baseline is None:
+                        # The first interval fills caches and pools; measure growth after it
+                        baseline = tracemalloc.take_snapshot()
+            self.snapshot(last_report)
+            growth = None
+            if options.tracemalloc:
+                final = tracemalloc.take_snapshot()
+                growth = final.compare_to(baseline, 'lineno')[:options.top] if baseline else None
+                tracemalloc.stop()
+        finally:
+            lag_task.cancel()
+            self.cog.watchdog.stop()
+            for guild in self.guilds:
+                self.cog.get_player(guild.id).queue.clear()
+                guild.voice.stop()
+            if self.tasks:
+                await asyncio.wait(list(self.tasks), timeout=10)
+        return growth
+
+    def report(self, growth):
+        ttfa, gaps, worst = [], [], []
+        for guild in self.guilds:
+            guild_ttfa = self._ttfa(guild)
+            ttfa.extend(guild_ttfa)
+            gaps.extend(self._gaps(guild))
+            if guild_ttfa:
+                worst.append((max(guild_ttfa), guild.id, len(guild_ttfa)))
+        worst.sort(reverse=True)
+        lags = [lag for _, lag in self.lag]
+        first, last = self.samples[0], self.samples[-1]
+        minutes = max((last['t'] - first['t']) / 60, 1e-9)
+        return {
+            'guilds': len(self.guilds),
+            'duration_s': last['t'],
+            'commands': self.issued,
+            'ttfa_ms': _summary(ttfa),
+            'guild_worst_ttfa': [{'guild': g, 'max_ms': t * 1000, 'plays': n} for t, g, n in worst[:5]],
+            'track_gap_ms': _summary(gaps),
+            'tracks_started': sum(len(g.voice.first_frame) for g in self.guilds),
+            'frames': sum(g.voice.frames for g in self.guilds),
+            'underruns': sum(g.voice.underruns for g in self.guilds),
+            'guilds_with_underruns': sum(1 for g in self.guilds if g.voice.underruns),
+            'loop_lag_ms': _summary(lags),
+            'loop_stalls': len(self.cog.watchdog.stalls),
+            'commands_ms': {name: _summary(v) for name, v in self.command_latency.items()},
+            'command_errors': {name: n for name, n in self.command_errors.items() if n},
+            'extract_calls': self.cog.ytdl_yt.calls + self.cog.ytdl_bili.calls,
+            'rss_mb': {'first_sample': first['rss_mb'], 'last': last['rss_mb'],
+                       'growth_per_min': (last['rss_mb'] - first['rss_mb']) / minutes},
+            'samples': self.samples,
+            'allocation_growth': [str(stat) for stat in growth] if growth else None,
+        }
+
+    @staticmethod
+    def _ttfa(guild):
+        """Time from each play on an idle guild to that guild's next first frame."""
+        frames = guild.voice.first_frame
+        result, i = [], 0
+        for requested in guild.requests:
+            while i < len(frames) and frames[i] < requested:
+                i += 1
+            if i < len(frames):
+                result.append(frames[i] - requested)
+        return result
+
+    @staticmethod
+    def _gaps(guild):
+        """Silence between a track ending (or being skipped) and the next one starting, while the queue ran on."""
+        voice, requests = guild.voice, guild.requests
+        gaps = []
+        for ended in voice.finished:
+            following = next((f for f in voice.first_frame if f >= ended), None)
+            if following is None:
+                continue
+            # An idle period ended by a new play isn't a gap
+            if any(ended <= r <= following for r in requests):
+                continue
+            gaps.append(following - ended)
+        return gaps
+
+
+def _summary(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values) * 1000,
+        'p50': percentile(values, 0.50) * 1000,
+        'p90': percentile(values, 0.90) * 1000,
+        'p99': percentile(values, 0.99) * 1000,
+        'max': max(values) * 1000,
+    }
+
+
+def _command(name):
+    import cogs.music as music
+    return getattr(music.Music, name)
+
+
+# name -> fn(load_test, guild) returning (command, args, kwargs)
+COMMANDS = {
+    'play': lambda lt, g: (_command('play'), (), {'query': lt.song()}),
+    'skip': lambda lt, g: (_command('skip'), (), {}),
+    'queue': lambda lt, g: (_command('queue_info'), (), {}),
+    'queue_move': lambda lt, g: (_command('queue_move'), (lt.position(g), lt.position(g)), {}),
+    'queue_remove': lambda lt, g: (_command('queue_remove'), (lt.position(g),), {}),
+    'nowplaying': lambda lt, g: (_command('nowplaying'), (), {}),
+    'shuffle': lambda lt, g: (_command('shuffle'), (), {}),
+    'loop': lambda lt, g: (_command('loop'), (), {}),
+    'stop': lambda lt, g: (_command('stop'), (), {}),
+    'playlist_load': lambda lt, g: (_command('pl_load'), (lt.rng.choice(lt.playlists),), {}),
+    'playlist_show': lambda lt, g: (_command('pl_show'), (lt.rng.choice(lt.playlists),), {'page': lt.rng.randint(1, 4)}),
+    'playlist_add': lambda lt, g: (_command('pl_add'), (lt.rng.choice(lt.playlists),),
+                                   {'song_query': ', '.join(lt.song() for _ in range(lt.rng.randint(1, 5)))}),
+}
+
+
+def print_report(report):
+    def line(label, s):
+        if not s.get('count'):
+            return f"{label:<22}(none)"
+        return (f"{label:<22}n={s['count']:<7} p50={s['p50']:>8.1f}  p90={s['p90']:>8.1f}  "
+                f"p99={s['p99']:>8.1f}  max={s['max']:>8.1f} ms")
+
+    print(f"\n{report['guilds']} guilds, {report['duration_s']:.0f}s, {report['commands']} commands, "
+          f"{report['tracks_started']} tracks started, {report['extract_calls']} extractions")
+    print(line('time to first audio', report['ttfa_ms']))
+    print(line('gap between tracks', report['track_gap_ms']))
+    print(line('event loop lag', report['loop_lag_ms']))
+    print(f"{'underruns':<22}{report['underruns']} of {report['frames']} frames "
+          f"({report['guilds_with_underruns']} guilds affected), {report['loop_stalls']} loop stalls")
+    rss = report['rss_mb']
+    print(f"{'memory (RSS)':<22}{rss['first_sample']:.1f} -> {rss['last']:.1f} MiB ({rss['growth_per_min']:+.2f} MiB/min)")
+    if report['guild_worst_ttfa']:
+        print("worst guilds (TTFA):   " + ', '.join(f"{w['guild']}: {w['max_ms']:.0f}ms" for w in report['guild_worst_ttfa']))
+    print("\ncommand latency:")
+    for name, s in report['commands_ms'].items():
+        print('  ' + line(name, s))
+    if report['command_errors']:
+        print("command errors: " + ', '.join(f"{k}={v}" for k, v in report['command_errors'].items()))
+    if report['allocation_growth']:
+        print("\nallocation growth since the first interval:")
+        for stat in report['allocation_growth']:
+            print(f"  {stat}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Many-guild load test for the music cog.")
+    parser.add_argument('--guilds', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=60, help="Seconds to run.")
+    parser.add_argument('--rate', type=float, default=10, help="Commands per second across all guilds.")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Command weights (default: {DEFAULT_MIX}).")
+    parser.add_argument('--track-seconds', type=float, default=20, help="Length of every fake track.")
+    parser.add_argument('--delay', type=float, default=0.4, help="Mean seconds per fake extract_info() call.")
+    parser.add_argument('--jitter', type=float, default=0.5, help="Spread of the extraction delay (0.5 = +/-50%%).")
+    parser.add_argument('--startup', type=float, default=0.05, help="Seconds before a fake track's first frame.")
+    parser.add_argument('--channel-latency', type=float, default=0.05, help="Seconds per fake Discord message send.")
+    parser.add_argument('--catalog', type=int, default=5000, help="Distinct songs to draw from.")
+    parser.add_argument('--fail-percent', type=int, default=2, help="Share of search songs YouTube refuses (0-100).")
+    parser.add_argument('--playlists', type=int, default=20)
+    parser.add_argument('--playlist-size', type=int, default=300, help="Largest saved playlist.")
+    parser.add_argument('--report-every', type=float, default=10, help="Seconds between progress samples.")
+    parser.add_argument('--tracemalloc', action='store_true', help="Report allocation growth by line (slower).")
+    parser.add_argument('--top', type=int, default=15, help="Lines of allocation growth to show.")
+    parser.add_argument('--count-objects', action='store_true', help="Record the number of live GC objects per sample.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='FILE', help="Also write the full report, with samples, to FILE.")
+    parser.add_argument('--verbose', action='store_true', help="Show the cog's own log output.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    parse_mix(options.mix)  # Fail early on a typo
+    import cogs.music as music
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        async with music_cog(loop) as cog:
+            cog.ytdl_yt = FakeYoutubeDL(cog.yt_opts, delay=options.delay, jitter=options.jitter, failing=('(blocked)',))
+            cog.ytdl_bili = FakeYoutubeDL(cog.bili_opts, delay=options.delay, jitter=options.jitter,
+                                          watch_url='https://www.bilibili.com/video/BV{}')
+            test = LoadTest(cog, options)
+            await test.setup()
+            frames = max(1, int(options.track_seconds / 0.02))
+            with fake_ffmpeg(music, frames=frames, startup=options.startup):
+                growth = await test.run()
+            return test.report(growth)
+
+    with contextlib.redirect_stdout(sys.stderr if options.verbose else open(os.devnull, 'w')):
+        report = asyncio.run(run())
+    print_report(report)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Records a real extract_info() result as a benchmark payload.
+
+    python -m benchmarks.record "https://www.youtube.com/watch?v=..." youtube_video
+
+Uses the cog's YouTube options (cookies, player clients), so the payload
+has the shape the bot actually sees. Needs network access.
+"""
+import json
+import os
+import sys
+
+import yt_dlp
+
+from benchmarks.fakes import PAYLOAD_DIR
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        sys.exit("usage: python -m benchmarks.record <url> <payload name>")
+    url, name = argv
+
+    import cogs.music as music
+    options = dict(music.ytdl_format_options, quiet=True)
+    options['extractor_args'] = {'youtube': {'player_client': ['tv', 'ios', 'android', 'mweb'],
+                                             'player_skip': ['webpage', 'configs']}}
+    if os.path.exists(music.cookie_path):
+        options['cookiefile'] = music.cookie_path
+    music.ensure_node_path()
+
+    with yt_dlp.YoutubeDL(options) as ydl:
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+    # Cookies and per-request headers are specific to this machine
+    info.pop('cookies', None)
+    for fmt in info.get('formats') or []:
+        fmt.pop('cookies', None)
+
+    path = os.path.join(PAYLOAD_DIR, f'{name}.json')
+    with open(path, 'w') as f:
+        json.dump(info, f, indent=1)
+    print(f"Saved {len(info.get('formats') or [])} formats to {path}")
+
+
+if __name__ == '__main__':
+    main()
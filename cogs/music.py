@@ -6,14 +6,31 @@ import asyncio
 import os
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
-from collections import deque
 import random
-import json
-import aiohttp
 import sys
 import subprocess
+import threading
 import traceback
 import re
+import io
+import time
+import urllib.parse as urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.audio_cache import AudioCache
+from utils.health import HealthTracker
+from utils.lru import LRUCache
+from utils import metrics
+from utils.outbox import Outbox
+from utils.playlist_store import PlaylistStore
+from utils.resolver import ProcessResolver, RoutedExtractor, extract_stream_info
+from utils.routes import RouteTable
+from utils.scheduler import ExtractionScheduler, PRIORITY_HEDGE, PRIORITY_PLAYBACK, PRIORITY_PREFETCH, PRIORITY_BULK
+from utils.spotify import MatchTable, SpotifyCatalog, spotify_session
+from utils.suggest import SuggestionClient
+from utils.track_cache import TrackCache, canonical_track_id
+from utils.track_queue import TrackQueue
+from utils.watchdog import LoopWatchdog, format_stall
 
 # Suppress noise from youtube_dl and fix bug with generic extractor
 yt_dlp.utils.bug_reports_message = lambda *args, **kwargs: ''
@@ -73,17 +90,57 @@ def ensure_node_path():
         except Exception as e:
             print(f"WARNING: Node.js check failed: {e}")
 
-ensure_node_path()
-
 cookie_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cookies.txt')
-print(f"Looking for cookies at: {cookie_path}")
-if os.path.exists(cookie_path):
-    print(f"Cookies found! Size: {os.path.getsize(cookie_path)} bytes")
-else:
-    print("WARNING: cookies.txt NOT FOUND at expected path!")
+
+_extraction_env_ready = False
+_extraction_env_lock = threading.Lock()
+
+def prepare_extraction_environment():
+    """Fixes up PATH for node and checks for cookies, once, before the first extractor is built."""
+    global _extraction_env_ready
+    with _extraction_env_lock:
+        if _extraction_env_ready:
+            return
+        ensure_node_path()
+        print(f"Looking for cookies at: {cookie_path}")
+        if os.path.exists(cookie_path):
+            print(f"Cookies found! Size: {os.path.getsize(cookie_path)} bytes")
+        else:
+            print("WARNING: cookies.txt NOT FOUND at expected path!")
+        _extraction_env_ready = True
+
+def probe_environment():
+    """Collects the versions and paths !status reports (blocking; spawns node)."""
+    import platform
+    import shutil
+
+    cookie_info = "Not found"
+    if os.path.exists(cookie_path):
+        cookie_info = f"Exists ({os.path.getsize(cookie_path)} bytes)"
+
+    node_path = shutil.which("node")
+    node_version = "N/A"
+    if node_path:
+        try:
+            node_version = subprocess.check_output([node_path, "--version"], text=True, timeout=10).strip()
+        except Exception:
+            node_version = "Error"
+
+    return {
+        'ytdlp': yt_dlp.version.__version__,
+        'ffmpeg': ffmpeg_executable,
+        'node': node_version,
+        'python': platform.python_version(),
+        'cookies': cookie_info,
+        'probed_at': time.time(),
+    }
+
+# How often the environment snapshot shown by !status is refreshed (seconds)
+ENVIRONMENT_REFRESH_INTERVAL = 600
 
 # Set cachedir to a specific persistent directory
-cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'music_cache')
+data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+cache_dir = os.path.join(data_dir, 'music_cache')
 if not os.path.exists(cache_dir):
     os.makedirs(cache_dir)
 
@@ -119,6 +176,54 @@ ffmpeg_streaming_options = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -reconnect_on_network_error 1 -reconnect_at_eof 1'
 }
 
+# Opus streams up to this bitrate (kbps) are sent to Discord without re-encoding
+OPUS_PASSTHROUGH_MAX_ABR = 256
+opus_passthrough_enabled = os.getenv('OPUS_PASSTHROUGH', '1') != '0'
+
+def is_passthrough_capable(data):
+    """True if a resolved track is Opus audio that Discord can take as-is."""
+    if data.get('local_file'):
+        return os.path.splitext(data['stream_url'])[1].lower() in ('.webm', '.opus', '.ogg')
+    stream_format = data.get('stream_format') or {}
+    abr = stream_format.get('abr')
+    return stream_format.get('acodec') == 'opus' and (not abr or abr <= OPUS_PASSTHROUGH_MAX_ABR)
+
+# Hedged resolution: a YouTube track with no stream after HEDGE_AFTER_MS (0 turns
+# it off) is also searched on Bilibili, and whichever arrives first plays
+HEDGE_AFTER = int(os.getenv('HEDGE_AFTER_MS', '3000')) / 1000
+HEDGE_MIN_ABR = 64  # kbps; weaker stand-ins only play if YouTube fails outright
+HEDGE_MIN_DURATION = 60  # seconds; shorter stand-ins are usually clips, not the song
+
+def is_acceptable_standin(data):
+    """True if a Bilibili result is good enough to play without waiting for YouTube."""
+    if data.get('is_live'):
+        return False
+    duration = data.get('duration')
+    if duration and duration < HEDGE_MIN_DURATION:
+        return False
+    abr = (data.get('stream_format') or {}).get('abr')
+    return not abr or abr >= HEDGE_MIN_ABR
+
+# YouTube playlist imports (`playlist add`)
+PLAYLIST_IMPORT_CONCURRENCY = 8
+PLAYLIST_PROGRESS_INTERVAL = 3  # seconds between progress edits
+UNAVAILABLE_TITLES = ('[Private video]', '[Deleted video]', '[Unavailable video]')
+PLAYLIST_PAGE_SIZE = 25  # songs per `playlist show` page
+QUEUE_PAGE_SIZE = 10  # songs per `queue` page
+
+# Player message rendering: updates within the delay are merged into one
+# edit, and the message is re-sent once this many messages were posted below it
+PLAYER_RENDER_DELAY = 0.75
+PLAYER_RESEND_AFTER = 5
+
+# Spotify tracks searched per round by the background matcher
+MATCH_BATCH_SIZE = 8
+
+# YouTube player clients; each gets its own extractor and they are tried
+# one at a time, healthiest first (see HealthTracker)
+YOUTUBE_PLAYER_CLIENTS = ('tv', 'ios', 'android', 'mweb')
+HEALTH_WINDOW = 300  # seconds of extraction outcomes that count towards a path's health
+
 # Pool of User-Agents to rotate
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -140,97 +245,81 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.is_live = data.get('is_live', False)
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True, ctx=None, source_type='youtube', ytdl_instance=None):
+    async def from_url(cls, url, *, loop=None, stream=True, ctx=None, source_type='youtube', ytdl_instance=None, cache=None,
+                       scheduler=None, audio_cache=None):
+        guild_id = ctx.guild.id if ctx and ctx.guild else None
+        data = await cls.resolve(url, loop=loop, stream=stream, ytdl_instance=ytdl_instance, cache=cache,
+                                 scheduler=scheduler, guild_id=guild_id, audio_cache=audio_cache)
+        return cls.from_resolved(data, stream=stream, source_type=source_type)
+
+    @classmethod
+    async def resolve(cls, url, *, loop=None, stream=True, ytdl_instance=None, cache=None,
+                      scheduler=None, guild_id=None, priority=PRIORITY_PLAYBACK, audio_cache=None):
+        """Extracts info for url and picks the stream URL, without spawning ffmpeg.
+
+        With a TrackCache, a known track is served from the AudioCache if it
+        was downloaded, a still-valid cached stream skips extraction
+        entirely, and a known search query goes straight to its video page.
+        With an ExtractionScheduler the work is queued there for guild_id at
+        the given priority instead of running on the default executor.
+        """
         loop = loop or asyncio.get_event_loop()
         
         if not ytdl_instance:
              # Fallback if no instance provided, though Music cog should provide it
              ytdl_instance = yt_dlp.YoutubeDL(ytdl_format_options)
 
-        # Extract info.
-        try:
-            # We use download=False but we need process=True to get formats
-            # The previous call might have been too shallow
-            data = await loop.run_in_executor(None, lambda: ytdl_instance.extract_info(url, download=not stream))
-        except Exception as e:
-            err_msg = str(e).strip().split('\n')[-1]
-            print(f"ERROR: Failed to extract info for {url}: {err_msg}")
-            raise e
-
-        if 'entries' in data:
-            # take first item from a playlist
-            if not data['entries']:
-                raise Exception("No search results found.")
-            data = data['entries'][0]
-
-        # RE-EXTRACT IF NECESSARY
-        # If the initial URL is a webpage or we don't have enough format data, force deep extraction
-        initial_url = data.get('url', '')
-        is_webpage = "youtube.com" in initial_url or "youtu.be" in initial_url
-        has_no_formats = 'formats' not in data or len(data.get('formats', [])) < 5
-        
-        if is_webpage or has_no_formats:
-            search_url = data.get('webpage_url') or initial_url
-            if search_url and ("youtube.com" in search_url or "youtu.be" in search_url):
-                print(f"DEBUG: Data is shallow, performing deep extraction for: {search_url}")
-                data = await loop.run_in_executor(None, lambda: ytdl_instance.extract_info(search_url, download=not stream))
-
-        if not data or ('formats' not in data and stream):
-             raise Exception("No playable formats found. This might be due to YouTube signature challenges or IP blocking.")
-
-        # Ensure we have a title
-        if 'title' not in data:
-            data['title'] = "Unknown Title"
-        
-        # FIND THE BEST AUDIO STREAM
-        filename = None
-        if 'formats' in data:
+        def _resolve():
+            target = url
+            known = cache.lookup(url) if cache and stream else None
+            if known:
+                if audio_cache:
+                    local_path = audio_cache.path_for(canonical_track_id(known.get('webpage_url')))
+                    if local_path:
+                        print(f"DEBUG: Playing from audio cache: {local_path}")
+                        return dict(known, stream_url=local_path, local_file=True)
+                cached = cache.lookup_stream(url)
+                if cached:
+                    print(f"DEBUG: Stream cache hit for: {url}")
+                    return cached
+                target = known.get('webpage_url') or url
+            source = 'bilibili' if 'bilibili' in target or 'b23.tv' in target or target.startswith('bilisearch') else 'youtube'
+            started = time.perf_counter()
             try:
-                # 1. Primary: Pure Audio (no video codec)
-                audio_formats = [
-                    f for f in data['formats'] 
-                    if f.get('vcodec') == 'none' 
-                    and f.get('acodec') != 'none' 
-                    and f.get('url')
-                    and f.get('ext') != 'mhtml'
-                ]
-                
-                # 2. Fallback: Any format that HAS audio (progressive streams)
-                if not audio_formats:
-                    audio_formats = [
-                        f for f in data['formats'] 
-                        if f.get('acodec') != 'none' 
-                        and f.get('url')
-                        and f.get('ext') != 'mhtml'
-                    ]
-                    if audio_formats:
-                         print("DEBUG: Using progressive format as fallback.")
-                
-                if audio_formats:
-                    # Sort by quality (abr)
-                    audio_formats.sort(key=lambda x: x.get('abr', 0) or 0, reverse=True)
-                    # Prefer googlevideo URLs
-                    gv_formats = [f for f in audio_formats if ".googlevideo.com" in f.get('url', '')]
-                    if gv_formats:
-                        filename = gv_formats[0]['url']
-                    else:
-                        filename = audio_formats[0]['url']
-            except Exception as e:
-                print(f"DEBUG: Format sorting failed: {e}")
-
-        # Fallback to top-level url
-        if not filename:
-            filename = data.get('url')
+                # Process-pool extractors resolve remotely and return compact info
+                resolve_stream = getattr(ytdl_instance, 'resolve_stream', None)
+                if resolve_stream:
+                    data = resolve_stream(target, stream)
+                else:
+                    data = extract_stream_info(ytdl_instance, target, stream)
+            except Exception:
+                metrics.EXTRACTIONS.inc(source=source, outcome='error')
+                raise
+            metrics.EXTRACT_SECONDS.observe(time.perf_counter() - started, source=source)
+            metrics.EXTRACTIONS.inc(source=source, outcome='ok')
+            metrics.EXTRACT_CALLS.inc(data.get('extract_calls', 1), source=source)
+            if data.get('extract_calls', 1) > 1:
+                metrics.DEEP_EXTRACTIONS.inc(source=source)
+            if cache:
+                cache.store(url, data)
+            return data
+
+        if scheduler:
+            return await scheduler.run(_resolve, guild_id=guild_id, priority=priority, tag='queue')
+        return await loop.run_in_executor(None, _resolve)
 
-        if not filename:
-             raise Exception("Failed to resolve a direct stream URL.")
-        
-        print(f"DEBUG: Playing Title: {data.get('title')}")
-        print(f"DEBUG: Final Stream URL: {filename[:100]}...")
-        
+    @classmethod
+    def from_resolved(cls, data, *, stream=True, source_type='youtube', volume=None):
+        """Builds a playable source from the result of resolve().
+
+        With no volume set (source level), Opus tracks are remuxed straight
+        into Discord frames by a YTDLOpusSource. Everything else, and any
+        track that needs volume scaling, goes through the PCM path.
+        """
+        filename = data['stream_url']
         _ffmpeg_options = {}
         
-        if stream:
+        if stream and not data.get('local_file'):
             _ffmpeg_options = ffmpeg_streaming_options.copy()
             
             headers = data.get('http_headers', {})
@@ -253,17 +342,27 @@ class YTDLSource(discord.PCMVolumeTransformer):
         else:
             _ffmpeg_options = ffmpeg_options.copy()
 
-        return cls(discord.FFmpegPCMAudio(filename, executable=ffmpeg_executable, **_ffmpeg_options), data=data, filename=filename)
+        if opus_passthrough_enabled and volume in (None, 1.0) and is_passthrough_capable(data):
+            metrics.FFMPEG_SPAWNS.inc(mode='opus_copy')
+            return YTDLOpusSource(filename, data=data, **_ffmpeg_options)
+
+        metrics.FFMPEG_SPAWNS.inc(mode='pcm')
+        return cls(discord.FFmpegPCMAudio(filename, executable=ffmpeg_executable, **_ffmpeg_options), data=data, filename=filename,
+                   volume=1.0 if volume is None else volume)
 
     def cleanup(self):
         super().cleanup()
 
     @classmethod
-    async def search_source(cls, query, *, loop=None, ytdl_instance=None):
+    async def search_source(cls, query, *, loop=None, ytdl_instance=None, scheduler=None, guild_id=None):
         loop = loop or asyncio.get_event_loop()
         if not ytdl_instance:
             return []
-        data = await loop.run_in_executor(None, lambda: ytdl_instance.extract_info(f"ytsearch5:{query}", download=False))
+        search = lambda: ytdl_instance.extract_info(f"ytsearch5:{query}", download=False)
+        if scheduler:
+            data = await scheduler.run(search, guild_id=guild_id, priority=PRIORITY_PLAYBACK)
+        else:
+            data = await loop.run_in_executor(None, search)
         
         if 'entries' not in data:
             return []
@@ -278,6 +377,17 @@ class YTDLSource(discord.PCMVolumeTransformer):
             })
         return results
 
+class YTDLOpusSource(discord.FFmpegOpusAudio):
+    """Opus passthrough: ffmpeg only remuxes the stream, nothing is decoded or scaled in Python."""
+    def __init__(self, filename, *, data, **ffmpeg_kwargs):
+        super().__init__(filename, codec='copy', executable=ffmpeg_executable, **ffmpeg_kwargs)
+        self.data = data
+        self.filename = filename
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.duration = data.get('duration')
+        self.is_live = data.get('is_live', False)
+
 class SearchSelect(discord.ui.Select):
     def __init__(self, ctx, results, music_cog):
         self.ctx = ctx
@@ -311,12 +421,15 @@ class SearchSelect(discord.ui.Select):
         
         await interaction.response.defer()
         
-        self.music_cog.queue.append((selected_song['url'], self.ctx.author.id))
+        player = self.music_cog.get_player(self.ctx.guild.id)
+        self.music_cog.remember_title(selected_song['url'], selected_song['title'])
+        player.queue.append((selected_song['url'], self.ctx.author.id))
         
         if self.ctx.voice_client and not self.ctx.voice_client.is_playing():
             await self.music_cog.play_next(self.ctx)
         else:
             await interaction.followup.send(f"SUCCESS: Queued **{selected_song['title']}**")
+            self.music_cog.schedule_prefetch(player)
             await self.music_cog.update_player(self.ctx)
 
 class SearchView(discord.ui.View):
@@ -356,7 +469,11 @@ class PlayerView(discord.ui.View):
 
     @discord.ui.button(label="STOP", style=discord.ButtonStyle.secondary)
     async def stop(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.music_cog.queue.clear()
+        player = self.music_cog.get_player(self.ctx.guild.id)
+        player.queue.clear()
+        player.invalidate_prefetch()
+        self.music_cog.scheduler.cancel(player.guild_id, tag='queue')
+        self.music_cog.cancel_matching(player.guild_id)
         if self.ctx.voice_client:
             self.ctx.voice_client.stop()
         await interaction.response.send_message("Stopped and cleared queue.", ephemeral=True)
@@ -364,31 +481,95 @@ class PlayerView(discord.ui.View):
 
     @discord.ui.button(label="SHUFFLE", style=discord.ButtonStyle.secondary)
     async def shuffle(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.music_cog.is_shuffling = not self.music_cog.is_shuffling
-        status = "enabled" if self.music_cog.is_shuffling else "disabled"
+        player = self.music_cog.get_player(self.ctx.guild.id)
+        player.is_shuffling = not player.is_shuffling
+        self.music_cog.schedule_prefetch(player)
+        status = "enabled" if player.is_shuffling else "disabled"
         await interaction.response.send_message(f"Shuffle {status}.", ephemeral=True)
         await self.music_cog.update_player(self.ctx)
 
     @discord.ui.button(label="LOOP", style=discord.ButtonStyle.secondary)
     async def loop(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.music_cog.is_looping = not self.music_cog.is_looping
-        status = "enabled" if self.music_cog.is_looping else "disabled"
+        player = self.music_cog.get_player(self.ctx.guild.id)
+        player.is_looping = not player.is_looping
+        self.music_cog.schedule_prefetch(player)
+        status = "enabled" if player.is_looping else "disabled"
         await interaction.response.send_message(f"Loop {status}.", ephemeral=True)
         await self.music_cog.update_player(self.ctx)
 
+class GuildPlayer:
+    """Playback state for a single guild."""
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.queue = TrackQueue()
+        self.current_song = None
+        self.current_source = None
+        self.player_message = None
+        self.is_looping = False
+        self.is_shuffling = False
+        self.shuffle_pick = None      # Entry at the head of the queue that shuffle mode chose (or was told) to play next
+        self.volume = None            # None plays at source level (allows Opus passthrough)
+        self.bili_retries = set()     # Track clean titles that were already fallbacked
+        self.prefetch_entry = None    # Queue entry the prefetch task is resolving
+        self.prefetch_task = None
+        self.render_ctx = None        # Context of the latest update_player() call
+        self.render_task = None       # Pending (debounced) player message render
+        self.render_resend = False    # Next render must send a new message
+        self.render_lock = asyncio.Lock()
+        self.rendered_embed = None    # Embed dict currently shown in player_message
+        self.messages_since_player = 0  # Channel messages posted below player_message
+
+    def pick_next(self):
+        """In shuffle mode, brings a random entry to the front of the queue to be played next.
+
+        Only one pick is made ahead, and it stands until it is played or
+        leaves the front of the queue. Played entries leave the queue, so
+        nothing repeats until everything has played, and songs added
+        meanwhile are simply part of the next draw. Each pick is one
+        O(log n) move; the rest of the queue keeps its order.
+        """
+        if not self.is_shuffling or not self.queue:
+            return
+        if self.shuffle_pick is not None and self.queue[0] is self.shuffle_pick:
+            return
+        if len(self.queue) > 1:
+            self.queue.move(random.randrange(len(self.queue)), 0)
+        self.shuffle_pick = self.queue[0]
+
+    def pin_next(self):
+        """Keeps shuffle mode from replacing the entry now at the front of the queue."""
+        self.shuffle_pick = self.queue[0] if self.queue else None
+
+    def invalidate_prefetch(self):
+        """Drops the pre-resolved next track, e.g. after the queue was reordered."""
+        if self.prefetch_task and not self.prefetch_task.done():
+            self.prefetch_task.cancel()
+        self.prefetch_task = None
+        self.prefetch_entry = None
+
+    def take_prefetch(self, entry):
+        """Returns the prefetch task for entry if it is the one being resolved."""
+        task = self.prefetch_task
+        if task is None or self.prefetch_entry is not entry:
+            self.invalidate_prefetch()
+            return None
+        self.prefetch_task = None
+        self.prefetch_entry = None
+        return task
+
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         
         # YouTube specific options
-        yt_opts = ytdl_format_options.copy()
+        self.yt_opts = yt_opts = ytdl_format_options.copy()
         yt_opts.update({
             'format': 'bestaudio/best',
             'cookiefile': cookie_path,
             'javascript_executor': 'node',
             'extractor_args': {
                 'youtube': {
-                    'player_client': ['tv', 'ios', 'android', 'mweb'],
+                    'player_client': list(YOUTUBE_PLAYER_CLIENTS),
                     'player_skip': ['webpage', 'configs'],
                     # Fix signature solving issues
                     'remote_components': 'ejs:github',
@@ -398,10 +579,9 @@ class Music(commands.Cog):
             'nocheckcertificate': True,
             'prefer_insecure': True,
         })
-        self.ytdl_yt = yt_dlp.YoutubeDL(yt_opts)
 
         # Bilibili specific options
-        bili_opts = ytdl_format_options.copy()
+        self.bili_opts = bili_opts = ytdl_format_options.copy()
         bili_opts.update({
             'format': 'bestaudio/best',
             'http_headers': {
@@ -409,64 +589,377 @@ class Music(commands.Cog):
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
             }
         })
-        self.ytdl_bili = yt_dlp.YoutubeDL(bili_opts)
 
-        self.queue = deque()
-        self.current_song = None
-        self.current_source = None
-        self.player_messages = {} # guild_id -> Message
-        self.is_looping = False
-        self.is_shuffling = False
+        # One option set per extraction path: each YouTube player client on its own, and Bilibili
+        self.path_opts = {}
+        for client in YOUTUBE_PLAYER_CLIENTS:
+            client_opts = dict(yt_opts, extractor_args={'youtube': dict(yt_opts['extractor_args']['youtube'],
+                                                                        player_client=[client])})
+            self.path_opts[f'youtube:{client}'] = client_opts
+        self.path_opts['bilibili'] = bili_opts
+        self.health = HealthTracker(window=HEALTH_WINDOW)
+
+        # Extractors are built on first use (see extractor()) so they stay off the startup path
+        self._extractors = {}  # source -> RoutedExtractor
+        self._clients = {}     # path -> YoutubeDL (or a PooledExtractor)
+        self._extractor_lock = threading.Lock()
+
+        # RESOLVER_PROCESSES > 0 moves extraction into warm worker processes
+        self.resolver = None
+        resolver_processes = int(os.getenv('RESOLVER_PROCESSES', '0'))
+        if resolver_processes > 0:
+            # Workers inherit PATH when they spawn
+            prepare_extraction_environment()
+            self.resolver = ProcessResolver(
+                self.path_opts,
+                workers=resolver_processes,
+                max_jobs=int(os.getenv('RESOLVER_MAX_JOBS', '100')),
+            )
+            for path in self.path_opts:
+                self._clients[path] = self.resolver.extractor(path)
+            print(f"Process-pool resolver enabled ({resolver_processes} workers).")
+
+        self.players = {} # guild_id -> GuildPlayer
+        self.track_cache = TrackCache(os.path.join(data_dir, 'track_cache.db'))
+        self.suggestions = SuggestionClient()
+        self.audio_cache = AudioCache(cache_dir, max_bytes=int(os.getenv('AUDIO_CACHE_MB', '2048')) * 1024 * 1024)
+        # Downloads take minutes; they get their own threads so they never hold an extraction worker
+        self.download_executor = ThreadPoolExecutor(max_workers=max(1, int(os.getenv('AUDIO_CACHE_WORKERS', '1'))),
+                                                    thread_name_prefix='audio-cache')
+        # HEDGE_WORKERS more threads are kept for Bilibili backups racing stalled YouTube lookups
+        self.scheduler = ExtractionScheduler(workers=int(os.getenv('EXTRACT_WORKERS', '4')),
+                                             reserved=int(os.getenv('HEDGE_WORKERS', '2')))
+        self.outbox = Outbox()
+        self.environment = {}  # Snapshot from probe_environment(), see refresh_environment()
+        self.environment_task = None
+        self.lag_task = None
+        # Loop stalls longer than STALL_THRESHOLD_MS are recorded for !stalls
+        self.watchdog = LoopWatchdog(threshold=int(os.getenv('STALL_THRESHOLD_MS', '500')) / 1000,
+                                     on_stall=self.on_loop_stall)
+        self.metrics_server = None
+        self.matches = MatchTable(os.path.join(data_dir, 'spotify_cache.db'))
+        self.match_tasks = {}  # guild_id -> running match_tracks() tasks
+        self.routes = RouteTable(os.path.join(data_dir, 'routes.db'))
+        # Titles from search results and playlist listings, so a Bilibili backup needn't ask YouTube
+        self.titles = LRUCache(maxsize=4096)  # canonical track ID -> title
         self.autoplay = False
-        self.playlist_dir = 'data/playlists'
-        self.bili_retries = set()     # Track clean titles that were already fallbacked
-        
-        if not os.path.exists(self.playlist_dir):
-            os.makedirs(self.playlist_dir)
-
-        self.spotify = None
-        client_id = os.getenv('SPOTIPY_CLIENT_ID')
-        client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
-        if client_id and client_secret:
+        # Pre-SQLite versions kept one JSON file per playlist in data/playlists/
+        self.playlists = PlaylistStore(os.path.join(data_dir, 'playlists.db'), legacy_dir=os.path.join(data_dir, 'playlists'))
+
+        self._spotify = None
+        self._spotify_loaded = False
+
+    def client(self, path):
+        """Returns the extractor for one path ('youtube:tv', 'bilibili'), building it on first use."""
+        ytdl = self._clients.get(path)
+        if ytdl is None:
+            with self._extractor_lock:
+                ytdl = self._clients.get(path)
+                if ytdl is None:
+                    prepare_extraction_environment()
+                    ytdl = yt_dlp.YoutubeDL(self.path_opts[path])
+                    self._clients[path] = ytdl
+        return ytdl
+
+    def extractor(self, name):
+        """Returns the extractor for 'youtube' or 'bilibili'.
+
+        It routes each resolution over that source's paths in order of
+        recent health, and records the outcomes in self.health.
+        """
+        ytdl = self._extractors.get(name)
+        if ytdl is None:
+            with self._extractor_lock:
+                ytdl = self._extractors.get(name)
+                if ytdl is None:
+                    paths = {path: (lambda path=path: self.client(path))
+                             for path in self.path_opts if path.split(':')[0] == name}
+                    ytdl = self._extractors[name] = RoutedExtractor(self.health, name, paths)
+        return ytdl
+
+    @property
+    def ytdl_yt(self):
+        return self.extractor('youtube')
+
+    @ytdl_yt.setter
+    def ytdl_yt(self, ytdl):
+        self._extractors['youtube'] = ytdl
+
+    @property
+    def ytdl_bili(self):
+        return self.extractor('bilibili')
+
+    @ytdl_bili.setter
+    def ytdl_bili(self, ytdl):
+        self._extractors['bilibili'] = ytdl
+
+    @property
+    def spotify(self):
+        """The SpotifyCatalog, created on first use; None without credentials."""
+        if not self._spotify_loaded:
+            self._spotify_loaded = True
+            client_id = os.getenv('SPOTIPY_CLIENT_ID')
+            client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
+            if client_id and client_secret:
+                try:
+                    # 429s are left to SpotifyCatalog, which backs off without holding a thread
+                    client = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=client_id, client_secret=client_secret),
+                                             requests_session=spotify_session())
+                    self._spotify = SpotifyCatalog(client, os.path.join(data_dir, 'spotify_cache.db'))
+                    print("Spotify integration enabled.")
+                except Exception as e:
+                    print(f"Spotify integration failed: {e}")
+            else:
+                print("Spotify credentials not found. Spotify support disabled.")
+        return self._spotify
+
+    async def cog_load(self):
+        self.environment_task = self.bot.loop.create_task(self.refresh_environment())
+        self.lag_task = self.bot.loop.create_task(
+            metrics.monitor_loop_lag(metrics.LOOP_LAG, metrics.LOOP_LAG_SECONDS))
+        metrics.REGISTRY.add_collector(self.collect_metrics)
+        self.watchdog.start()
+        # METRICS_PORT exposes /metrics on localhost (METRICS_HOST to change the interface)
+        metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        if metrics_port:
+            self.metrics_server = metrics.MetricsServer(metrics.REGISTRY, host=os.getenv('METRICS_HOST', '127.0.0.1'),
+                                                        port=metrics_port)
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                print(f"WARNING: Could not start metrics endpoint: {e}")
+                self.metrics_server = None
+        # Build the extractors in the background so the first song doesn't wait for them
+        for path in self.path_opts:
+            warmup = self.bot.loop.run_in_executor(None, self.client, path)
+            warmup.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def refresh_environment(self):
+        """Keeps self.environment (the !status snapshot) up to date in the background."""
+        while True:
             try:
-                self.spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=client_id, client_secret=client_secret))
-                print("Spotify integration enabled.")
+                self.environment = await self.bot.loop.run_in_executor(None, probe_environment)
             except Exception as e:
-                print(f"Spotify integration failed: {e}")
-        else:
-            print("Spotify credentials not found. Spotify support disabled.")
+                print(f"WARNING: Environment probe failed: {e}")
+            await asyncio.sleep(ENVIRONMENT_REFRESH_INTERVAL)
+
+    def on_loop_stall(self, record):
+        # Runs on the watchdog thread while the loop is still blocked
+        metrics.LOOP_STALLS.inc()
+        print(f"WARNING: Event loop blocked for >{record['overdue']:.2f}s"
+              + (f" during {record['context']}" if record['context'] else "")
+              + (f"\n{''.join(record['stack'][-3:])}" if record['stack'] else ""))
+
+    def collect_metrics(self):
+        """Scrape-time gauges for state the cog already tracks."""
+        track_stats = self.track_cache.stats()
+        audio_stats = self.audio_cache.stats()
+        health = self.health.snapshot()
+        return [
+            ('musicbot_queue_depth', "Tracks waiting in each guild's queue.",
+             [({'guild': guild_id}, len(player.queue)) for guild_id, player in self.players.items()]),
+            ('musicbot_cache_hit_ratio', "Hit ratio of the metadata and audio caches.",
+             [({'cache': 'track'}, track_stats['hit_rate']), ({'cache': 'audio'}, audio_stats['hit_rate'])]),
+            ('musicbot_cache_lookups_total', "Cache lookups since start, by result.",
+             [({'cache': 'track', 'result': 'hit'}, track_stats['hits']),
+              ({'cache': 'track', 'result': 'miss'}, track_stats['misses']),
+              ({'cache': 'track', 'result': 'stream_hit'}, track_stats['stream_hits']),
+              ({'cache': 'audio', 'result': 'hit'}, audio_stats['hits']),
+              ({'cache': 'audio', 'result': 'miss'}, audio_stats['misses'])], 'counter'),
+            ('musicbot_audio_cache_bytes', "Bytes of audio kept in the local cache.", [({}, audio_stats['bytes'])]),
+            ('musicbot_extraction_jobs_pending', "Extraction jobs waiting for a worker.",
+             [({}, self.scheduler.pending())]),
+            ('musicbot_extraction_path_success_ratio', "Share of recent extractions that worked, per source and client.",
+             [({'path': path}, stats['success_rate']) for path, stats in health.items() if stats['attempts']]),
+            ('musicbot_extraction_path_latency_seconds', "Mean time of recent working extractions, per source and client.",
+             [({'path': path}, stats['latency']) for path, stats in health.items() if stats['latency'] is not None]),
+            ('musicbot_extraction_path_open', "1 while a path's circuit breaker keeps it out of rotation.",
+             [({'path': path}, int(stats['state'] == 'open')) for path, stats in health.items()]),
+        ]
 
-    async def safe_send(self, ctx, content):
-        """Safely send a message, ignoring errors if the channel is unknown/gone."""
-        try:
-            return await ctx.send(content)
-        except (discord.NotFound, discord.HTTPException) as e:
-            print(f"Warning: Could not send message to channel {ctx.channel.id}: {e}")
-            return None
+    async def cog_unload(self):
+        if self.environment_task:
+            self.environment_task.cancel()
+        if self.lag_task:
+            self.lag_task.cancel()
+        metrics.REGISTRY.remove_collector(self.collect_metrics)
+        self.watchdog.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        self.outbox.close()
+        await self.suggestions.close()
+        self.scheduler.shutdown()
+        self.download_executor.shutdown(wait=False, cancel_futures=True)
+        self.audio_cache.flush()
+        if self.resolver:
+            self.resolver.shutdown()
+        self.track_cache.close()
+        self.playlists.close()
+        self.matches.close()
+        self.routes.close()
+        if self._spotify:
+            self._spotify.close()
+
+    def get_player(self, guild_id):
+        """Returns the player for a guild, creating it on first use."""
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+        return player
+
+    def route_query(self, query):
+        """Returns (source_type, ytdl_instance, search_query) for a queue entry (blocking)."""
+        is_bili = "bilibili.com" in query or "b23.tv" in query
+        is_yt_url = "youtube.com" in query or "youtu.be" in query
+
+        if is_bili:
+            return 'bilibili', self.ytdl_bili, query
+        # Entries that only played from Bilibili last time go straight there
+        routed = self.routes.get(query)
+        if routed:
+            return 'bilibili', self.ytdl_bili, routed
+        if is_yt_url:
+            return 'youtube', self.ytdl_yt, query
+        # A search term; skip the search if the background matcher already found the video
+        matched = None if query.startswith('http') else self.matches.get(query)
+        return 'youtube', self.ytdl_yt, matched or f"ytsearch:{query}"
+
+    def schedule_prefetch(self, player):
+        """Starts resolving the head of the queue in the background."""
+        if player.is_looping or len(player.queue) == 0:
+            player.invalidate_prefetch()
+            return
 
-    async def get_spotify_tracks(self, url):
+        player.pick_next()
+        entry = player.queue[0]
+        if player.prefetch_entry is entry and player.prefetch_task:
+            return
+
+        player.invalidate_prefetch()
+        task = self.bot.loop.create_task(self.prefetch(player.guild_id, entry[0]))
+        # Failures are reported when the entry is actually played
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        player.prefetch_entry = entry
+        player.prefetch_task = task
+
+    async def prefetch(self, guild_id, query):
+        """Routes and resolves a queue entry ahead of its turn."""
+        # Routing reads SQLite on a miss; keep it off the loop
+        _, ytdl_inst, search_query = await self.bot.loop.run_in_executor(None, self.route_query, query)
+        return await YTDLSource.resolve(
+            search_query, loop=self.bot.loop, stream=True, ytdl_instance=ytdl_inst, cache=self.track_cache,
+            scheduler=self.scheduler, guild_id=guild_id, priority=PRIORITY_PREFETCH, audio_cache=self.audio_cache)
+
+    def track_info(self, url):
+        """Returns metadata for a track URL, from the track cache when possible (blocking)."""
+        info = self.track_cache.lookup(url)
+        if info is None:
+            info = self.ytdl_yt.extract_info(url, download=False)
+            self.track_cache.store(url, info)
+        return info
+
+    def search_match(self, query):
+        """Returns the watch URL of the top YouTube result for query, or None (blocking)."""
+        data = self.ytdl_yt.extract_info(f"ytsearch1:{query}", download=False)
+        entries = [e for e in (data or {}).get('entries') or [] if e and e.get('id')]
+        if not entries:
+            return None
+        url = f"https://www.youtube.com/watch?v={entries[0]['id']}"
+        self.remember_title(url, entries[0].get('title'))
+        return url
+
+    def remember_title(self, url, title):
+        """Notes the title a listing gave for a track URL, for bili_search_terms()."""
+        track_id = canonical_track_id(url)
+        if track_id and title and title not in UNAVAILABLE_TITLES:
+            self.titles.set(track_id, title)
+
+    async def match_tracks(self, guild_id, tracks):
+        """Searches [(spotify_id, query)] ahead of playback and records the matches.
+
+        Work goes through the scheduler at bulk priority in queue order, a
+        batch at a time, so tracks near the head of the queue are matched
+        first and a long playlist never crowds out playback.
+        """
+        todo = await self.bot.loop.run_in_executor(None, self.matches.unmatched, tracks)
+        for i in range(0, len(todo), MATCH_BATCH_SIZE):
+            batch = todo[i:i + MATCH_BATCH_SIZE]
+            found = await asyncio.gather(*(
+                self.scheduler.run(self.search_match, query, guild_id=guild_id, priority=PRIORITY_BULK, tag='match')
+                for _, query in batch
+            ), return_exceptions=True)
+            # Errors may be transient; only "no results" is remembered as a failure
+            results = [(spotify_id, query, url) for (spotify_id, query), url in zip(batch, found)
+                       if not isinstance(url, BaseException)]
+            if results:
+                await self.bot.loop.run_in_executor(None, self.matches.record, results)
+            if any(isinstance(url, asyncio.CancelledError) for url in found):
+                return  # cancel_matching() dropped the batch; drop the rest too
+
+    def schedule_matching(self, guild_id, tracks):
+        """Starts match_tracks() in the background."""
+        tracks = [(spotify_id, query) for spotify_id, query in tracks if not query.startswith('http')]
+        if tracks:
+            task = self.bot.loop.create_task(self.match_tracks(guild_id, tracks))
+            tasks = self.match_tasks.setdefault(guild_id, set())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def cancel_matching(self, guild_id):
+        """Stops background matching for a guild, including batches not queued yet."""
+        for task in self.match_tasks.pop(guild_id, ()):
+            task.cancel()
+        self.scheduler.cancel(guild_id, tag='match')
+
+    def cache_track(self, guild_id, track_id, url):
+        """Downloads a track into the audio cache in the background, on self.download_executor."""
+        if track_id.startswith('bilibili:'):
+            options = self.bili_opts
+        else:
+            # The YouTube player client that is working best right now
+            options = self.path_opts[self.health.rank([path for path in self.path_opts if path.startswith('youtube:')],
+                                                      probe=False)[0]]
+        future = self.bot.loop.run_in_executor(self.download_executor, self.audio_cache.download, track_id, url, options)
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def note_play(self, player, data):
+        """Counts a play and starts caching the track once it is hot."""
+        track_id = canonical_track_id(data.get('webpage_url'))
+        if self.audio_cache.record_play(track_id, duration=data.get('duration'), is_live=data.get('is_live')):
+            self.cache_track(player.guild_id, track_id, data['webpage_url'])
+
+    async def safe_send(self, ctx, content, *, key=None):
+        """Queues a status message for ctx's channel; bursts are merged into one message.
+
+        A later message with the same key replaces this one if it hasn't
+        been sent yet. Errors (e.g. the channel is gone) are only logged.
+        """
+        self.outbox.post(ctx.channel, content, key=key)
+
+    async def cog_before_invoke(self, ctx):
+        # Status messages wait while a command is replying in the channel
+        self.outbox.hold(ctx.channel)
+        guild = ctx.guild.id if ctx.guild else 'DM'
+        self.watchdog.label_current_task(f"{ctx.prefix}{ctx.command.qualified_name} by {ctx.author.id} in guild {guild}")
+
+    async def cog_after_invoke(self, ctx):
+        self.outbox.release(ctx.channel)
+        self.watchdog.clear_current_task()
+
+    async def spotify_batches(self, url, guild_id=None):
+        """Yields lists of "Artist - Title" queries for a Spotify link, page by page.
+
+        Each page is also handed to the background matcher.
+        """
         if not self.spotify:
-            return []
-        results = []
-        try:
-            if 'track' in url:
-                track = self.spotify.track(url)
-                results.append(f"{track['artists'][0]['name']} - {track['name']}")
-            elif 'playlist' in url:
-                playlist = self.spotify.playlist_items(url)
-                for item in playlist['items']:
-                    track = item['track']
-                    if track:
-                        results.append(f"{track['artists'][0]['name']} - {track['name']}")
-            elif 'album' in url:
-                album = self.spotify.album_tracks(url)
-                for item in album['items']:
-                    results.append(f"{item['artists'][0]['name']} - {item['name']}")
-        except Exception as e:
-            print(f"Error fetching Spotify tracks: {e}")
-        return results
+            return
+        async for batch in self.spotify.stream(url):
+            self.schedule_matching(guild_id, batch)
+            yield [query for _, query in batch]
 
     def create_player_embed(self, source, ctx):
+        player = self.get_player(ctx.guild.id)
         embed = discord.Embed(
             title="NOW PLAYING",
             description=f"**[{source.title}]({source.url})**",
@@ -503,58 +996,115 @@ class Music(commands.Cog):
         
         embed.add_field(name="STATUS", value=status, inline=True)
         
-        loop_status = "ON" if self.is_looping else "OFF"
-        shuffle_status = "ON" if self.is_shuffling else "OFF"
+        loop_status = "ON" if player.is_looping else "OFF"
+        shuffle_status = "ON" if player.is_shuffling else "OFF"
         embed.add_field(name="LOOP", value=loop_status, inline=True)
         embed.add_field(name="SHUFFLE", value=shuffle_status, inline=True)
 
-        if len(self.queue) > 0:
-            next_song = self.queue[0][0]
+        if len(player.queue) > 0:
+            next_song = player.queue[0][0]
             embed.add_field(name="NEXT SONG", value=next_song[:50] + ("..." if len(next_song) > 50 else ""), inline=False)
 
         embed.set_footer(text="SPOTIFY INTERACTIVE PLAYER")
         return embed
 
-    async def update_player(self, ctx, source=None):
+    async def update_player(self, ctx, source=None, *, resend=False):
+        """Schedules a redraw of the player message.
+
+        Calls within PLAYER_RENDER_DELAY collapse into a single render, which
+        edits the existing message in place, skips the edit if nothing
+        visible changed, and only sends a new message once the old one has
+        scrolled away (or resend is set).
+        """
+        player = self.get_player(ctx.guild.id)
         if source:
-            self.current_source = source
+            player.current_source = source
         
-        if not self.current_source:
+        if not player.current_source:
             return
 
-        embed = self.create_player_embed(self.current_source, ctx)
-        view = PlayerView(self, ctx)
-        
-        guild_id = ctx.guild.id
-        old_msg = self.player_messages.get(guild_id)
+        player.render_ctx = ctx
+        player.render_resend = player.render_resend or resend
+        if player.render_task is None or player.render_task.done():
+            player.render_task = self.bot.loop.create_task(self.render_player(player))
+
+    async def render_player(self, player):
+        await asyncio.sleep(PLAYER_RENDER_DELAY)
+        async with player.render_lock:
+            # Updates arriving from here on schedule another render
+            player.render_task = None
+            ctx = player.render_ctx
+            resend, player.render_resend = player.render_resend, False
+            if not player.current_source or self.players.get(player.guild_id) is not player:
+                return
 
-        # Delete old message to keep chat clean and ensure player is at the bottom
-        if old_msg:
-            try:
-                await old_msg.delete()
-            except:
-                pass
+            embed = self.create_player_embed(player.current_source, ctx)
+            rendered = embed.to_dict()
+            old_msg = player.player_message
 
-        try:
-            new_msg = await ctx.send(embed=embed, view=view)
-            self.player_messages[guild_id] = new_msg
-        except Exception as e:
-            print(f"ERROR: Could not send player message: {e}")
+            scrolled_away = (old_msg is None or old_msg.channel.id != ctx.channel.id
+                             or player.messages_since_player >= PLAYER_RESEND_AFTER)
+            if not resend and not scrolled_away:
+                if rendered == player.rendered_embed:
+                    return
+                try:
+                    await old_msg.edit(embed=embed)
+                    player.rendered_embed = rendered
+                    return
+                except discord.NotFound:
+                    pass  # Deleted by someone; send a new one
+                except discord.HTTPException as e:
+                    print(f"ERROR: Could not edit player message: {e}")
+                    return
+
+            # Delete old message to keep chat clean and ensure player is at the bottom
+            if old_msg:
+                try:
+                    await old_msg.delete()
+                except discord.HTTPException:
+                    pass
 
-    async def trigger_bili_fallback(self, ctx, query, requester_id):
-        """Fallback to Bilibili for YouTube failures."""
-        if query in self.bili_retries:
-            return await self.play_next(ctx)
+            try:
+                player.player_message = await ctx.channel.send(embed=embed, view=PlayerView(self, ctx))
+                player.rendered_embed = rendered
+                player.messages_since_player = 0
+            except Exception as e:
+                player.player_message = None
+                print(f"ERROR: Could not send player message: {e}")
 
-        self.bili_retries.add(query)
-        
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        # Counts how far the player message has been pushed up its channel
+        if not message.guild:
+            return
+        player = self.players.get(message.guild.id)
+        player_msg = player.player_message if player else None
+        if player_msg and message.channel.id == player_msg.channel.id and message.id != player_msg.id:
+            player.messages_since_player += 1
+
+    async def bili_search_terms(self, guild_id, query, lookup=True):
+        """Turns a queue entry into Bilibili search text: the title for URLs, minus the usual junk.
+
+        A URL's title comes from the track cache or a listing it was seen
+        in (self.titles); failing that, it is looked up on YouTube, unless
+        `lookup` is off, in which case the URL's own text is searched.
+        """
         search_query = query
         if query.startswith('http'):
             try:
                 # Try to get info to extract title
-                info = await self.bot.loop.run_in_executor(None, lambda: self.ytdl_yt.extract_info(query, download=False, process=False))
+                info = await self.bot.loop.run_in_executor(None, self.track_cache.lookup, query)
+                if info is None:
+                    title = self.titles.get(canonical_track_id(query))
+                    if title:
+                        info = {'title': title}
+                    elif lookup:
+                        info = await self.scheduler.run(lambda: self.ytdl_yt.extract_info(query, download=False, process=False),
+                                                        guild_id=guild_id, tag='queue')
+                    else:
+                        raise LookupError(query)
                 search_query = info.get('title', query)
-            except:
+            except Exception:
                 search_query = re.sub(r'https?://(www\.)?(youtube\.com/watch\?v=|youtu\.be/|bilibili\.com/video/)', '', query)
                 search_query = re.sub(r'[^\w\s]', ' ', search_query)
                 search_query = ' '.join(search_query.split()).strip()
@@ -572,49 +1122,135 @@ class Music(commands.Cog):
         ]
         for pattern in junk_patterns:
             clean_query = re.sub(pattern, "", clean_query, flags=re.IGNORECASE)
+
+        return ' '.join(clean_query.split()).strip()
+
+    async def trigger_bili_fallback(self, ctx, query, requester_id):
+        """Fallback to Bilibili for YouTube failures."""
+        player = self.get_player(ctx.guild.id)
+        if query in player.bili_retries:
+            metrics.BILI_FALLBACKS.inc(outcome='already_tried')
+            return await self.play_next(ctx)
+
+        player.bili_retries.add(query)
         
-        clean_query = ' '.join(clean_query.split()).strip()
+        clean_query = await self.bili_search_terms(ctx.guild.id, query)
         search_query_bili = f"{clean_query} music"
         
         await self.safe_send(ctx, f"FALLBACK: YouTube restricted this content. Searching Bilibili for: {clean_query}...")
         
         try:
             # Use bilisearch1: as requested
-            data = await self.bot.loop.run_in_executor(None, lambda: self.ytdl_bili.extract_info(f"bilisearch1:{search_query_bili}", download=False))
+            data = await self.scheduler.run(lambda: self.ytdl_bili.extract_info(f"bilisearch1:{search_query_bili}", download=False),
+                                            guild_id=ctx.guild.id, tag='queue')
             
             if 'entries' in data and data['entries']:
                 entry = data['entries'][0]
                 url = entry.get('webpage_url', entry.get('url'))
                 # Prepend to queue for immediate playback
-                self.queue.appendleft((url, requester_id))
+                player.queue.appendleft((url, requester_id))
+                player.pin_next()
+                metrics.BILI_FALLBACKS.inc(outcome='found')
             else:
+                metrics.BILI_FALLBACKS.inc(outcome='not_found')
                 await self.safe_send(ctx, "ERROR: No results found on Bilibili.")
         except Exception:
+            metrics.BILI_FALLBACKS.inc(outcome='error')
             await self.safe_send(ctx, "ERROR: Bilibili search failed.")
         
         await self.play_next(ctx)
 
-    async def play_next(self, ctx):
-        if self.is_looping and self.current_song:
-            self.queue.appendleft(self.current_song)
+    async def resolve_on_bilibili(self, guild_id, query):
+        """Resolves the top Bilibili search result for a queue entry, as a stand-in for YouTube."""
+        # YouTube is what's stalling; asking it for the title would serialize the backup behind it
+        terms = await self.bili_search_terms(guild_id, query, lookup=False)
+        return await YTDLSource.resolve(f"bilisearch1:{terms} music", loop=self.bot.loop, stream=True,
+                                        ytdl_instance=self.ytdl_bili, cache=self.track_cache, scheduler=self.scheduler,
+                                        guild_id=guild_id, priority=PRIORITY_HEDGE, audio_cache=self.audio_cache)
+
+    async def resolve_hedged(self, ctx, query, primary):
+        """Waits for primary, a YouTube resolve task, racing it against Bilibili if it is slow.
+
+        Once primary has taken HEDGE_AFTER seconds, or failed, the entry is
+        searched on Bilibili as well and the first result to arrive plays,
+        provided a Bilibili one passes is_acceptable_standin(); a weaker one
+        is kept in case YouTube fails too. The loser is cancelled (a yt-dlp
+        call already running finishes in the background and is dropped).
+        When YouTube actually failed, a Bilibili win is recorded in
+        self.routes so the entry goes straight there next time; merely being
+        slow (which includes waiting for a worker) doesn't route anything.
+        Returns (data, source_type).
+
+        A cancelled lookup (!stop and !leave drop the guild's jobs) is not a
+        failure: the cancellation is raised and nothing is hedged.
+        """
+        # Don't make anyone wait on YouTube while it is failing across the board,
+        # or race a Bilibili that is failing too
+        budget = 0 if self.health.is_open('youtube') else HEDGE_AFTER
+        await asyncio.wait({primary}, timeout=budget)
+        if not primary.done() and self.health.is_open('bilibili'):
+            await asyncio.wait({primary})
+        if primary.done() and (primary.cancelled() or primary.exception() is None):
+            return primary.result(), 'youtube'  # Raises CancelledError if it was cancelled
+
+        print(f"DEBUG: YouTube {'failed' if primary.done() else 'is slow'} for {query}; racing Bilibili")
+        backup = self.bot.loop.create_task(self.resolve_on_bilibili(ctx.guild.id, query))
+        pending = {primary, backup}
+        errors = {}
+        standin = None  # A Bilibili result below the bar, played only if YouTube fails
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, backup):
+                    if task not in done:
+                        continue
+                    if task.cancelled():
+                        raise asyncio.CancelledError()  # Stopped; the finally drops the other one
+                    if task.exception() is not None:
+                        errors[task] = task.exception()
+                    elif task is primary:
+                        metrics.HEDGES.inc(winner='youtube')
+                        return task.result(), 'youtube'
+                    elif is_acceptable_standin(task.result()) or primary not in pending:
+                        standin = task.result()
+                        pending = set()
+                        break
+                    else:
+                        standin = task.result()
+        finally:
+            for task in (primary, backup):
+                if not task.done():
+                    task.cancel()
+
+        if standin is None:
+            metrics.HEDGES.inc(winner='none')
+            raise errors.get(primary) or errors[backup]
+        metrics.HEDGES.inc(winner='bilibili')
+        if primary in errors and standin.get('webpage_url'):
+            await self.bot.loop.run_in_executor(None, self.routes.record, query, 'bilibili', standin['webpage_url'])
+        await self.safe_send(ctx, f"FALLBACK: YouTube was slow or restricted. Playing from Bilibili: **{standin.get('title', query)[:80]}**")
+        return standin, 'bilibili'
+
+    async def drop_route(self, query, source_type):
+        """Forgets the Bilibili route of an entry whose stand-in didn't play either."""
+        if source_type == 'bilibili' and not ("bilibili.com" in query or "b23.tv" in query):
+            await self.bot.loop.run_in_executor(None, self.routes.forget, query)
 
-        if len(self.queue) > 0:
-            query, requester_id = self.queue.popleft()
-            self.current_song = (query, requester_id)
-            
-            is_bili = "bilibili.com" in query or "b23.tv" in query
-            is_yt_url = "youtube.com" in query or "youtu.be" in query
+    async def play_next(self, ctx):
+        player = self.get_player(ctx.guild.id)
+        if player.is_looping and player.current_song:
+            player.queue.appendleft(player.current_song)
+            player.pin_next()
+
+        if len(player.queue) > 0:
+            player.pick_next()
+            entry = player.queue.popleft()
+            query, requester_id = entry
+            player.current_song = entry
+            prefetched = player.take_prefetch(entry)
+            started = time.perf_counter()
             
-            # Determine source_type and ytdl_instance
-            if is_bili:
-                source_type = 'bilibili'
-                ytdl_inst = self.ytdl_bili
-                search_query = query
-            else:
-                source_type = 'youtube'
-                ytdl_inst = self.ytdl_yt
-                # If it's not a URL, it's a search term
-                search_query = query if is_yt_url else f"ytsearch:{query}"
+            source_type, ytdl_inst, search_query = await self.bot.loop.run_in_executor(None, self.route_query, query)
 
             try:
                 if not ctx.voice_client:
@@ -623,47 +1259,76 @@ class Music(commands.Cog):
                     if requester and requester.voice:
                          await requester.voice.channel.connect(self_deaf=True)
                     else:
-                         self.queue.clear()
+                         player.queue.clear()
+                         player.invalidate_prefetch()
                          return
 
-                await self.safe_send(ctx, f"INFO: Loading: **{query[:50]}...**")
-                source = await YTDLSource.from_url(search_query, loop=self.bot.loop, stream=True, ctx=ctx, source_type=source_type, ytdl_instance=ytdl_inst)
+                if prefetched:
+                    pending = prefetched
+                else:
+                    await self.safe_send(ctx, f"INFO: Loading: **{query[:50]}...**", key='loading')
+                    pending = YTDLSource.resolve(search_query, loop=self.bot.loop, stream=True, ytdl_instance=ytdl_inst,
+                                                 cache=self.track_cache, scheduler=self.scheduler, guild_id=ctx.guild.id,
+                                                 audio_cache=self.audio_cache)
+                if source_type == 'youtube' and HEDGE_AFTER > 0:
+                    data, source_type = await self.resolve_hedged(ctx, query, asyncio.ensure_future(pending))
+                else:
+                    data = await pending
+                source = YTDLSource.from_resolved(data, stream=True, source_type=source_type, volume=player.volume)
                 
                 def after_playing(error):
                     if error:
+                        metrics.FFMPEG_ERRORS.inc()
                         print(f"ERROR: Playback error for {query}: {error}")
                         async def handle_error():
+                            # The cached stream URL may be what failed; don't hand it out again
+                            await self.bot.loop.run_in_executor(None, self.track_cache.invalidate_stream, search_query)
+                            if search_query != query and not search_query.startswith('ytsearch'):
+                                await self.bot.loop.run_in_executor(None, self.matches.forget, query)
                             await self.safe_send(ctx, f"ERROR: Playback error: {error}")
                             if source_type == 'youtube':
                                  await self.trigger_bili_fallback(ctx, query, requester_id)
                             else:
-                                 if query in self.bili_retries:
-                                     self.bili_retries.remove(query)
+                                 await self.drop_route(query, source_type)
+                                 if query in player.bili_retries:
+                                     player.bili_retries.remove(query)
                                  await self.play_next(ctx)
-                        self.bot.loop.create_task(handle_error())
+                        self.bot.loop.create_task(handle_error(), name=f"playback-error:{ctx.guild.id}")
                         return
                     
-                    if query in self.bili_retries:
-                        self.bili_retries.remove(query)
-                    self.bot.loop.create_task(self.play_next(ctx))
+                    if query in player.bili_retries:
+                        player.bili_retries.remove(query)
+                    self.bot.loop.create_task(self.play_next(ctx), name=f"play_next:{ctx.guild.id}")
 
                 ctx.voice_client.play(source, after=after_playing)
+                metrics.TIME_TO_FIRST_AUDIO.observe(time.perf_counter() - started, prefetched='yes' if prefetched else 'no')
+                metrics.TRACKS_STARTED.inc(source=source_type)
+                # Playback started before the loading note went out; it's moot now
+                self.outbox.discard(ctx.channel, 'loading')
+                self.schedule_prefetch(player)
+                self.note_play(player, data)
                 await self.update_player(ctx, source)
             
             except Exception as e:
                 err_msg = str(e).strip().split('\n')[-1]
                 await self.safe_send(ctx, f"ERROR: Failed to load: **{query[:50]}**\n`{err_msg}`")
+                if search_query != query and not search_query.startswith('ytsearch'):
+                    # The remembered match didn't play; search again next time
+                    await self.bot.loop.run_in_executor(None, self.matches.forget, query)
                 
-                if source_type == 'youtube':
+                if source_type == 'youtube' and not HEDGE_AFTER:
                     await self.trigger_bili_fallback(ctx, query, requester_id)
                 else:
-                    if query in self.bili_retries:
-                        self.bili_retries.remove(query)
+                    # With hedging on, Bilibili was already tried while resolving
+                    await self.drop_route(query, source_type)
+                    if query in player.bili_retries:
+                        player.bili_retries.remove(query)
                     await self.play_next(ctx)
         else:
-            self.current_song = None
-            self.bili_retries.clear() # Clear all retries when queue is done
-            await self.safe_send(ctx, "INFO: Queue empty.")
+            player.current_song = None
+            player.invalidate_prefetch()
+            player.bili_retries.clear() # Clear all retries when queue is done
+            await self.safe_send(ctx, "INFO: Queue empty.", key='queue-empty')
 
     async def ensure_voice(self, ctx):
         if not ctx.voice_client:
@@ -682,27 +1347,11 @@ class Music(commands.Cog):
         return True
 
     async def play_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        if not current:
-            return []
-        
-        url = f"http://suggestqueries.google.com/complete/search?client=youtube&ds=yt&q={current}"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    pass # Simplified for brevity
-                
-        url = f"http://suggestqueries.google.com/complete/search?client=firefox&ds=yt&q={current}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = json.loads(await response.text())
-                    suggestions = data[1]
-                    return [
-                        app_commands.Choice(name=suggestion, value=suggestion)
-                        for suggestion in suggestions[:25] 
-                    ]
-        return []
+        suggestions = await self.suggestions.suggest(interaction.user.id, current)
+        return [
+            app_commands.Choice(name=suggestion[:100], value=suggestion[:100])
+            for suggestion in suggestions[:25]
+        ]
 
     @commands.hybrid_command(name='play', aliases=['p'], description="Plays a song or adds to queue.")
     @app_commands.describe(query="Song URL or search term.")
@@ -723,7 +1372,6 @@ class Music(commands.Cog):
         # Sanitize YouTube URL
         if 'youtube.com/watch' in query and 'list=' in query:
             try:
-                import urllib.parse as urlparse
                 parsed = urlparse.urlparse(query)
                 params = urlparse.parse_qs(parsed.query)
                 if 'v' in params:
@@ -731,22 +1379,29 @@ class Music(commands.Cog):
             except Exception:
                 pass
 
+        player = self.get_player(ctx.guild.id)
         if 'spotify.com' in query:
             msg = await ctx.send("INFO: Loading Spotify tracks...")
-            tracks = await self.get_spotify_tracks(query)
-            if not tracks:
+            queued = 0
+            started = False
+            try:
+                # Start playing as soon as the first page is in; later pages keep arriving
+                async for batch in self.spotify_batches(query, ctx.guild.id):
+                    player.queue.extend((track, ctx.author.id) for track in batch)
+                    queued += len(batch)
+                    if not started and ctx.voice_client and not ctx.voice_client.is_playing():
+                        started = True
+                        await self.play_next(ctx)
+                    else:
+                        self.schedule_prefetch(player)
+            except Exception as e:
+                print(f"Error fetching Spotify tracks: {e}")
+            if not queued:
                 return await msg.edit(content="ERROR: Failed to load Spotify tracks.")
-            for track in tracks:
-                self.queue.append((track, ctx.author.id))
-            
-            if ctx.voice_client and not ctx.voice_client.is_playing():
-                await msg.delete()
-                await self.play_next(ctx)
-            else:
-                await msg.edit(content=f"SUCCESS: Queued {len(tracks)} tracks.")
-                await self.update_player(ctx)
+            await msg.edit(content=f"SUCCESS: Queued {queued} tracks.")
+            await self.update_player(ctx)
         else:
-            self.queue.append((query, ctx.author.id))
+            player.queue.append((query, ctx.author.id))
             if ctx.voice_client and not ctx.voice_client.is_playing():
                 try:
                     await self.play_next(ctx)
@@ -755,6 +1410,7 @@ class Music(commands.Cog):
             else:
                 display_query = query if query.startswith('http') else f"SEARCH: {query}"
                 await ctx.send(f"SUCCESS: Queued {display_query}")
+                self.schedule_prefetch(player)
                 await self.update_player(ctx)
 
     @commands.hybrid_command(name='search', description="Searches YouTube and lets you select a song.")
@@ -766,7 +1422,8 @@ class Music(commands.Cog):
 
         msg = await ctx.send(f"SEARCHING: **{query}**...")
         try:
-            results = await YTDLSource.search_source(query, loop=self.bot.loop, ytdl_instance=self.ytdl_yt)
+            results = await YTDLSource.search_source(query, loop=self.bot.loop, ytdl_instance=self.ytdl_yt,
+                                                     scheduler=self.scheduler, guild_id=ctx.guild.id)
         except Exception as e:
              return await msg.edit(content=f"ERROR: Error searching: {e}")
         
@@ -781,45 +1438,106 @@ class Music(commands.Cog):
     async def playlist(self, ctx: commands.Context):
         await ctx.send("Available commands: create, add, remove, list, load, delete, show")
 
+    async def playlist_db(self, fn, *args):
+        """Runs a blocking PlaylistStore call off the event loop."""
+        return await self.bot.loop.run_in_executor(None, fn, *args)
+
     async def playlist_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        playlists = [f[:-5] for f in os.listdir(self.playlist_dir) if f.endswith('.json')]
-        return [
-            app_commands.Choice(name=pl, value=pl)
-            for pl in playlists if current.lower() in pl.lower()
-        ][:25]
+        playlists = await self.playlist_db(self.playlists.search_names, current)
+        return [app_commands.Choice(name=pl, value=pl) for pl in playlists]
 
     async def playlist_song_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[int]]:
         playlist_name = interaction.namespace.name
         if not playlist_name:
             return []
         
-        filepath = os.path.join(self.playlist_dir, f"{playlist_name}.json")
-        if not os.path.exists(filepath):
-            return []
-        
+        matches = await self.playlist_db(self.playlists.search, playlist_name, current.strip())
+        return [
+            app_commands.Choice(name=f"{index}. {song}"[:100], value=index)
+            for index, song in matches
+        ]
+
+    async def import_youtube_playlist(self, msg, url, add, guild_id):
+        """Adds a YouTube playlist's videos through add(urls), in playlist order.
+
+        Entries the flat listing already identifies are added as watch URLs
+        without another extraction; the rest are resolved concurrently at
+        bulk priority. Results are handed to add() in batches as soon as every
+        earlier entry is done, and msg is edited with progress along the way.
+        Returns (added_count, skipped_titles).
+        """
+        # 'noplaylist' would make a watch?v=...&list=... URL load just the video
+        list_id = urlparse.parse_qs(urlparse.urlparse(url).query).get('list', [None])[0]
+        if list_id:
+            url = f"https://www.youtube.com/playlist?list={list_id}"
+
+        data = await self.scheduler.run(lambda: self.ytdl_yt.extract_info(url, download=False),
+                                        guild_id=guild_id, priority=PRIORITY_BULK, tag='import')
+        entries = [e for e in (data.get('entries') or []) if e]
+        total = len(entries)
+        results = [None] * total          # watch URL, or False if unavailable
+        skipped = []
+        semaphore = asyncio.Semaphore(PLAYLIST_IMPORT_CONCURRENCY)
+
+        async def resolve(index, entry):
+            title = entry.get('title') or entry.get('url') or '?'
+            if title in UNAVAILABLE_TITLES:
+                results[index] = False
+                skipped.append(title)
+                return
+            if entry.get('id') and entry.get('ie_key', 'Youtube') == 'Youtube':
+                results[index] = f"https://www.youtube.com/watch?v={entry['id']}"
+                self.remember_title(results[index], entry.get('title'))
+                return
+            async with semaphore:
+                try:
+                    song_info = await self.scheduler.run(self.track_info, entry['url'],
+                                                         guild_id=guild_id, priority=PRIORITY_BULK, tag='import')
+                    results[index] = song_info.get('webpage_url', song_info.get('url', song_info.get('title')))
+                except Exception as e:
+                    print(f"Skipping playlist entry {title}: {e}")
+                    results[index] = False
+                    skipped.append(title)
+
+        pending = [asyncio.ensure_future(resolve(i, entry)) for i, entry in enumerate(entries)]
+        written = 0
+        added = 0
+        batch = []
+        last_progress = time.monotonic()
         try:
-            with open(filepath, 'r') as f:
-                tracks = json.load(f)
-        except:
-            return []
-            
-        choices = []
-        for i, song in enumerate(tracks):
-            label = f"{i+1}. {song}"[:100]
-            if current.lower() in label.lower():
-                choices.append(app_commands.Choice(name=label, value=i+1))
-        
-        return choices[:25]
+            for finished in asyncio.as_completed(pending):
+                await finished
+                # Collect the contiguous prefix that is done, keeping playlist order
+                while written < total and results[written] is not None:
+                    if results[written]:
+                        batch.append(results[written])
+                    written += 1
+                if time.monotonic() - last_progress >= PLAYLIST_PROGRESS_INTERVAL and written < total:
+                    last_progress = time.monotonic()
+                    if batch:
+                        await add(batch)
+                        added += len(batch)
+                        batch = []
+                    try:
+                        await msg.edit(content=f"INFO: Processing YouTube playlist... {written}/{total}")
+                    except discord.HTTPException:
+                        pass
+        finally:
+            for task in pending:
+                task.cancel()
+        if batch:
+            await add(batch)
+            added += len(batch)
+        return added, skipped
 
     @playlist.command(name='create', description="Creates a new empty playlist.")
     @app_commands.describe(name="The name of the playlist to create.")
     async def pl_create(self, ctx: commands.Context, name: str):
-        filepath = os.path.join(self.playlist_dir, f"{name}.json")
-        if os.path.exists(filepath):
+        name = name.strip()
+        if not name or len(name) > 100:
+            return await ctx.send("ERROR: Playlist names must be 1-100 characters long.")
+        if not await self.playlist_db(self.playlists.create, name):
             return await ctx.send(f"ERROR: Playlist **{name}** already exists.")
-        
-        with open(filepath, 'w') as f:
-            json.dump([], f)
         await ctx.send(f"SUCCESS: Playlist **{name}** created.")
 
     @playlist.command(name='add', description="Adds songs to a playlist. Supports URLs, search terms (comma-separated), or playlists.")
@@ -827,149 +1545,148 @@ class Music(commands.Cog):
     @app_commands.autocomplete(name=playlist_autocomplete)
     async def pl_add(self, ctx: commands.Context, name: str, *, song_query: str):
         await ctx.defer() 
-        filepath = os.path.join(self.playlist_dir, f"{name}.json")
-        if not os.path.exists(filepath):
+        if not await self.playlist_db(self.playlists.exists, name):
             return await ctx.send(f"ERROR: Playlist **{name}** not found.")
-        
-        with open(filepath, 'r') as f:
-            tracks = json.load(f)
 
-        added_count = 0
+        async def add(songs):
+            await self.playlist_db(self.playlists.append, name, songs)
+
         if 'list=' in song_query and ('youtube.com/playlist' in song_query or 'youtube.com/watch' in song_query): 
             msg = await ctx.send("INFO: Processing YouTube playlist...")
+            guild_id = ctx.guild.id if ctx.guild else None
             try:
-                loop = self.bot.loop or asyncio.get_event_loop()
-                data = await loop.run_in_executor(None, lambda: self.ytdl_yt.extract_info(song_query, download=False, process_info=False)) 
-
-                if 'entries' in data:
-                    for entry in data['entries']:
-                        song_info = await loop.run_in_executor(None, lambda: self.ytdl_yt.extract_info(entry['url'], download=False))
-                        tracks.append(song_info.get('webpage_url', song_info.get('url', song_info.get('title'))))
-                        added_count += 1
-                await msg.edit(content=f"SUCCESS: Added {added_count} songs from YouTube playlist to **{name}**.")
+                added_count, skipped = await self.import_youtube_playlist(msg, song_query, add, guild_id)
             except Exception as e:
                 await msg.edit(content=f"ERROR: Error processing YouTube playlist: {e}")
                 print(f"Error processing YouTube playlist: {e}")
                 return
+            report = f"SUCCESS: Added {added_count} songs from YouTube playlist to **{name}**."
+            if skipped:
+                report += f"\nSkipped {len(skipped)} unavailable: " + ", ".join(skipped)
+            await msg.edit(content=report[:2000])
         elif 'spotify.com' in song_query:
             msg = await ctx.send("INFO: Processing Spotify link...")
-            spotify_tracks = await self.get_spotify_tracks(song_query)
-            if not spotify_tracks:
+            added_count = 0
+            try:
+                async for batch in self.spotify_batches(song_query, ctx.guild.id if ctx.guild else None):
+                    await add(batch)
+                    added_count += len(batch)
+            except Exception as e:
+                print(f"Error fetching Spotify tracks: {e}")
+            if not added_count:
                 await msg.edit(content="ERROR: Could not load Spotify tracks.")
                 return
-            for track_title in spotify_tracks:
-                tracks.append(track_title)
-                added_count += 1
             await msg.edit(content=f"SUCCESS: Added {added_count} songs from Spotify link to **{name}**.")
         else:
             songs_to_add = [s.strip() for s in song_query.replace('|', ',').split(',') if s.strip()]
+            if not songs_to_add:
+                return await ctx.send("ERROR: No valid songs found to add.")
+            await add(songs_to_add)
             
-            for song in songs_to_add:
-                tracks.append(song)
-                added_count += 1
-            
-            if added_count > 1:
-                await ctx.send(f"SUCCESS: Added {added_count} songs to playlist **{name}**:\n" + ", ".join(songs_to_add)[:1900])
-            elif added_count == 1:
-                await ctx.send(f"SUCCESS: Added **{songs_to_add[0]}** to playlist **{name}**.")
+            if len(songs_to_add) > 1:
+                await ctx.send(f"SUCCESS: Added {len(songs_to_add)} songs to playlist **{name}**:\n" + ", ".join(songs_to_add)[:1900])
             else:
-                await ctx.send("ERROR: No valid songs found to add.")
-
-        with open(filepath, 'w') as f:
-            json.dump(tracks, f)
-
+                await ctx.send(f"SUCCESS: Added **{songs_to_add[0]}** to playlist **{name}**.")
 
     @playlist.command(name='list', description="Lists all saved playlists.")
     async def pl_list(self, ctx: commands.Context):
-        files = [f[:-5] for f in os.listdir(self.playlist_dir) if f.endswith('.json')]
-        if not files:
+        names = await self.playlist_db(self.playlists.names)
+        if not names:
             return await ctx.send("INFO: No playlists found.")
-        await ctx.send(f"**SAVED PLAYLISTS:**\n" + "\n".join(files))
+        await ctx.send((f"**SAVED PLAYLISTS:**\n" + "\n".join(names))[:2000])
 
     @playlist.command(name='load', description="Loads a playlist into the queue.")
     @app_commands.describe(name="The name of the playlist to load.")
     @app_commands.autocomplete(name=playlist_autocomplete)
     async def pl_load(self, ctx: commands.Context, name: str):
         await ctx.defer() 
-        filepath = os.path.join(self.playlist_dir, f"{name}.json")
-        if not os.path.exists(filepath):
+        if not await self.playlist_db(self.playlists.exists, name):
             return await ctx.send(f"ERROR: Playlist **{name}** not found.")
         
         if not await self.ensure_voice(ctx):
             return
 
-        with open(filepath, 'r') as f:
-            tracks = json.load(f)
+        tracks = await self.playlist_db(self.playlists.songs, name)
         
-        for track in tracks:
-            self.queue.append((track, ctx.author.id))
+        player = self.get_player(ctx.guild.id)
+        player.queue.extend((track, ctx.author.id) for track in tracks)
+        self.schedule_matching(ctx.guild.id, [(None, track) for track in tracks])
 
         if ctx.voice_client and not ctx.voice_client.is_playing():
             await self.play_next(ctx)
         else:
             await ctx.send(f"SUCCESS: Loaded {len(tracks)} songs from **{name}**.")
+            self.schedule_prefetch(player)
             await self.update_player(ctx)
     @playlist.command(name='delete', description="Deletes a playlist.")
     @app_commands.describe(name="The name of the playlist to delete.")
     @app_commands.autocomplete(name=playlist_autocomplete)
     async def pl_delete(self, ctx: commands.Context, name: str):
-        filepath = os.path.join(self.playlist_dir, f"{name}.json")
-        if not os.path.exists(filepath):
+        if not await self.playlist_db(self.playlists.delete, name):
             return await ctx.send(f"ERROR: Playlist **{name}** not found.")
-        os.remove(filepath)
         await ctx.send(f"SUCCESS: Playlist **{name}** deleted.")
 
     @playlist.command(name='show', description="Shows the songs in a playlist.")
-    @app_commands.describe(name="The name of the playlist.")
+    @app_commands.describe(name="The name of the playlist.", page="Page number (25 songs per page).")
     @app_commands.autocomplete(name=playlist_autocomplete)
-    async def pl_show(self, ctx: commands.Context, name: str):
-        filepath = os.path.join(self.playlist_dir, f"{name}.json")
-        if not os.path.exists(filepath):
+    async def pl_show(self, ctx: commands.Context, name: str, page: int = 1):
+        size = await self.playlist_db(self.playlists.size, name)
+        if size is None:
             return await ctx.send(f"ERROR: Playlist **{name}** not found.")
-        
-        with open(filepath, 'r') as f:
-            tracks = json.load(f)
-        
-        if not tracks:
+        if not size:
             return await ctx.send(f"INFO: Playlist **{name}** is empty.")
         
-        msg = f"**PLAYLIST {name}:**\n"
-        for i, song in enumerate(tracks):
-            msg += f"{i+1}. {song}\n"
-            if len(msg) > 1900:
+        pages = (size + PLAYLIST_PAGE_SIZE - 1) // PLAYLIST_PAGE_SIZE
+        page = max(1, min(page, pages))
+        songs = await self.playlist_db(self.playlists.page, name, (page - 1) * PLAYLIST_PAGE_SIZE, PLAYLIST_PAGE_SIZE)
+        
+        msg = f"**PLAYLIST {name}** (page {page}/{pages}, {size} songs):\n"
+        for index, song in songs:
+            line = f"{index}. {song}\n"
+            if len(msg) + len(line) > 1950:
                 msg += "...(truncated)"
                 break
+            msg += line
         await ctx.send(msg)
 
     @playlist.command(name='remove', description="Removes a song from a playlist by index.")
     @app_commands.describe(name="The name of the playlist.", index="The index of the song to remove.")
     @app_commands.autocomplete(name=playlist_autocomplete, index=playlist_song_autocomplete)
     async def pl_remove_song(self, ctx: commands.Context, name: str, index: int):
-        filepath = os.path.join(self.playlist_dir, f"{name}.json")
-        if not os.path.exists(filepath):
+        if not await self.playlist_db(self.playlists.exists, name):
             return await ctx.send(f"ERROR: Playlist **{name}** not found.")
         
-        with open(filepath, 'r') as f:
-            tracks = json.load(f)
-        
-        if index < 1 or index > len(tracks):
+        removed = await self.playlist_db(self.playlists.remove_at, name, index)
+        if removed is None:
             return await ctx.send(f"ERROR: Invalid index. Use `/playlist show {name}` to check indices.")
-        
-        removed = tracks.pop(index - 1)
-        
-        with open(filepath, 'w') as f:
-            json.dump(tracks, f)
         await ctx.send(f"SUCCESS: Removed **{removed}** from playlist **{name}**.")
 
     # --- Standard Controls ---
     @commands.hybrid_command(name='nowplaying', aliases=['np'], description="Shows the current playing song with controls.")
     async def nowplaying(self, ctx: commands.Context):
-        if not self.current_source:
+        if not self.get_player(ctx.guild.id).current_source:
             return await ctx.send("Nothing is playing.")
         
-        # Clear existing player message reference for this guild to force a new message if desired, 
-        # or just update it. Here we update.
-        await self.update_player(ctx)
+        # Bring the player back to the bottom of the channel
+        if ctx.interaction:
+            await ctx.send("Refreshing player...", ephemeral=True)
+        await self.update_player(ctx, resend=True)
+
+    @commands.hybrid_command(name='cache', description="Keeps the current song in the local audio cache.")
+    async def cache(self, ctx: commands.Context):
+        source = self.get_player(ctx.guild.id).current_source
+        if not source:
+            return await ctx.send("Nothing is playing.")
+
+        track_id = canonical_track_id(source.data.get('webpage_url'))
+        if not track_id or source.is_live:
+            return await ctx.send("ERROR: This song can't be cached.")
+
+        if self.audio_cache.mark_hot(track_id):
+            self.cache_track(ctx.guild.id, track_id, source.data['webpage_url'])
+            await ctx.send(f"SUCCESS: Caching **{source.title}** locally.")
+        else:
+            await ctx.send(f"INFO: **{source.title}** is already cached.")
 
     @commands.hybrid_command(name='skip', aliases=['s'], description="Skips the current song.")
     async def skip(self, ctx: commands.Context):
@@ -981,37 +1698,98 @@ class Music(commands.Cog):
 
     @commands.hybrid_command(name='stop', description="Stops playback and clears the queue.")
     async def stop(self, ctx: commands.Context):
-        self.queue.clear()
+        player = self.get_player(ctx.guild.id)
+        player.queue.clear()
+        player.invalidate_prefetch()
+        self.scheduler.cancel(ctx.guild.id, tag='queue')
+        self.cancel_matching(ctx.guild.id)
         if ctx.voice_client:
             ctx.voice_client.stop()
         await ctx.send("Stopped.")
         await self.update_player(ctx)
 
-    @commands.hybrid_command(name='queue', aliases=['q'], description="Displays the current queue.")
-    async def queue_info(self, ctx: commands.Context):
-        if len(self.queue) == 0:
+    @commands.hybrid_group(name='queue', aliases=['q'], fallback='show', invoke_without_command=True,
+                           description="Displays the current queue.")
+    @app_commands.describe(page="Page number (10 songs per page).")
+    async def queue_info(self, ctx: commands.Context, page: int = 1):
+        player = self.get_player(ctx.guild.id)
+        size = len(player.queue)
+        if size == 0:
             return await ctx.send("Queue is empty.")
-        msg = "**Queue:**\n"
-        for i, (query, _) in enumerate(list(self.queue)[:10]):
-            msg += f"{i+1}. {query}\n"
-        if len(self.queue) > 10:
-            msg += f"...and {len(self.queue) - 10} more."
+
+        pages = (size + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE
+        page = max(1, min(page, pages))
+        start = (page - 1) * QUEUE_PAGE_SIZE
+        msg = f"**Queue** (page {page}/{pages}, {size} songs):\n"
+        for i, (query, _) in enumerate(player.queue.page(start, QUEUE_PAGE_SIZE), start + 1):
+            msg += f"{i}. {query[:150]}\n"
+        if player.is_shuffling:
+            msg += "Shuffle is on: after #1, songs play in random order.\n"
+        mine = player.queue.count_by(ctx.author.id)
+        if mine:
+            msg += f"You have {mine} song{'s' if mine != 1 else ''} in the queue."
         await ctx.send(msg)
 
-    @commands.hybrid_command(name='shuffle', description="Shuffles the current queue.")
+    async def queue_changed(self, ctx, player):
+        """Re-targets the prefetch and player message after the queue was edited."""
+        self.schedule_prefetch(player)
+        await self.update_player(ctx)
+
+    @queue_info.command(name='remove', description="Removes a song from the queue by position.")
+    @app_commands.describe(index="Position of the song in the queue.")
+    async def queue_remove(self, ctx: commands.Context, index: int):
+        player = self.get_player(ctx.guild.id)
+        if not 1 <= index <= len(player.queue):
+            return await ctx.send(f"ERROR: Invalid position. The queue has {len(player.queue)} songs.")
+        query, _ = player.queue.pop(index - 1)
+        await ctx.send(f"SUCCESS: Removed **{query[:100]}** from the queue.")
+        await self.queue_changed(ctx, player)
+
+    @queue_info.command(name='move', description="Moves a song to another position in the queue.")
+    @app_commands.describe(source="Current position of the song.", destination="Position to move it to.")
+    async def queue_move(self, ctx: commands.Context, source: int, destination: int):
+        player = self.get_player(ctx.guild.id)
+        size = len(player.queue)
+        if not (1 <= source <= size and 1 <= destination <= size):
+            return await ctx.send(f"ERROR: Invalid position. The queue has {size} songs.")
+        query, _ = player.queue.move(source - 1, destination - 1)
+        if destination == 1:
+            player.pin_next()
+        await ctx.send(f"SUCCESS: Moved **{query[:100]}** to position {destination}.")
+        await self.queue_changed(ctx, player)
+
+    @queue_info.command(name='jump', description="Skips ahead to a song in the queue.")
+    @app_commands.describe(index="Position of the song to play now.")
+    async def queue_jump(self, ctx: commands.Context, index: int):
+        player = self.get_player(ctx.guild.id)
+        if not 1 <= index <= len(player.queue):
+            return await ctx.send(f"ERROR: Invalid position. The queue has {len(player.queue)} songs.")
+        player.queue.drop_front(index - 1)
+        player.pin_next()
+        query, _ = player.queue[0]
+        await ctx.send(f"Jumping to **{query[:100]}**.")
+        if ctx.voice_client and (ctx.voice_client.is_playing() or ctx.voice_client.is_paused()):
+            # Don't let loop mode put the current song back in front
+            player.current_song = None
+            ctx.voice_client.stop()
+        elif ctx.voice_client:
+            await self.play_next(ctx)
+
+    @commands.hybrid_command(name='shuffle', description="Toggles shuffle mode: the queue plays in random order.")
     async def shuffle(self, ctx: commands.Context):
-        if len(self.queue) < 2:
-            return await ctx.send("Not enough songs to shuffle.")
-        temp = list(self.queue)
-        random.shuffle(temp)
-        self.queue = deque(temp)
-        await ctx.send("Queue shuffled.")
+        player = self.get_player(ctx.guild.id)
+        player.is_shuffling = not player.is_shuffling
+        self.schedule_prefetch(player)
+        status = "On" if player.is_shuffling else "Off"
+        await ctx.send(f"Shuffle: **{status}**")
         await self.update_player(ctx)
 
     @commands.hybrid_command(name='loop', description="Toggles loop mode for the current song.")
     async def loop(self, ctx: commands.Context):
-        self.is_looping = not self.is_looping
-        status = "On" if self.is_looping else "Off"
+        player = self.get_player(ctx.guild.id)
+        player.is_looping = not player.is_looping
+        self.schedule_prefetch(player)
+        status = "On" if player.is_looping else "Off"
         await ctx.send(f"Loop: **{status}**")
         await self.update_player(ctx)
 
@@ -1029,51 +1807,82 @@ class Music(commands.Cog):
             return await ctx.send("Not connected to a voice channel.")
 
         if 0 <= volume <= 100:
-            ctx.voice_client.source.volume = volume / 100
-            await ctx.send(f"Volume changed to **{volume}%**")
+            self.get_player(ctx.guild.id).volume = volume / 100
+            source = ctx.voice_client.source
+            if isinstance(source, discord.PCMVolumeTransformer):
+                source.volume = volume / 100
+                await ctx.send(f"Volume changed to **{volume}%**")
+            else:
+                # Passthrough streams are never decoded, so they can't be scaled mid-song
+                await ctx.send(f"Volume changed to **{volume}%** (applies from the next song)")
         else:
             await ctx.send("Please enter a volume between 0 and 100.")
 
     @commands.hybrid_command(name='status', description="Reports the current status of the bot's environment.")
     async def status(self, ctx: commands.Context):
-        import yt_dlp
-        import platform
-        import shutil
-        
-        ytdlp_version = yt_dlp.version.__version__
-        ffmpeg_path = ffmpeg_executable
-        python_version = platform.python_version()
-        
-        cookie_info = "Not found"
-        if os.path.exists(cookie_path):
-            size = os.path.getsize(cookie_path)
-            cookie_info = f"Exists ({size} bytes)"
-            
-        node_path = shutil.which("node")
-        node_version = "N/A"
-        if node_path:
-            try:
-                node_version = subprocess.check_output([node_path, "--version"], text=True).strip()
-            except:
-                node_version = "Error"
-
-        # Check cache size
-        cache_size_bytes = 0
-        for f in os.listdir(cache_dir):
-            cache_size_bytes += os.path.getsize(os.path.join(cache_dir, f))
-        cache_size_mb = cache_size_bytes / (1024 * 1024)
+        env = self.environment
+        if not env:
+            # First probe hasn't finished yet
+            env = await self.bot.loop.run_in_executor(None, probe_environment)
+            self.environment = env
+
+        cache_stats = self.audio_cache.stats()
+        cache_size_mb = cache_stats['bytes'] / (1024 * 1024)
+        cache_limit_mb = cache_stats['max_bytes'] / (1024 * 1024)
+        cache_age = ""
+        if cache_stats['oldest']:
+            oldest = time.strftime('%Y-%m-%d', time.localtime(cache_stats['oldest']))
+            newest = time.strftime('%Y-%m-%d %H:%M', time.localtime(cache_stats['newest']))
+            cache_age = f", used {oldest} .. {newest}"
+
+        track_stats = self.track_cache.stats()
+
+        resolved = sum(metrics.EXTRACTIONS.value(source=source, outcome='ok') for source in ('youtube', 'bilibili'))
+        calls = sum(metrics.EXTRACT_CALLS.value(source=source) for source in ('youtube', 'bilibili'))
+        per_track = f"{calls / resolved:.2f}" if resolved else "n/a"
+
+        paths = []
+        for path, stats in self.health.snapshot().items():
+            if stats['state'] == 'open':
+                paths.append(f"{path} OFF")
+            elif stats['attempts']:
+                latency = f" {stats['latency']:.1f}s" if stats['latency'] is not None else ""
+                paths.append(f"{path} {stats['success_rate']:.0%}{latency}")
 
         report = (
             f"**ENVIRONMENT STATUS**\n"
-            f"YT-DLP: `{ytdlp_version}`\n"
-            f"FFmpeg: `{ffmpeg_path}`\n"
-            f"Node.js: `{node_version}`\n"
-            f"Python: `{python_version}`\n"
-            f"Cookies: `{cookie_info}`\n"
-            f"Cache Size: `{cache_size_mb:.2f} MB`"
+            f"YT-DLP: `{env['ytdlp']}`\n"
+            f"FFmpeg: `{env['ffmpeg']}`\n"
+            f"Node.js: `{env['node']}`\n"
+            f"Python: `{env['python']}`\n"
+            f"Cookies: `{env['cookies']}`\n"
+            f"Cache Size: `{cache_size_mb:.2f} / {cache_limit_mb:.0f} MB, {cache_stats['files']} files{cache_age}`\n"
+            f"Audio Cache: `{cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%})`\n"
+            f"Track Cache: `{track_stats['hits']} hits / {track_stats['misses']} misses "
+            f"({track_stats['hit_rate']:.0%}), {track_stats['stream_hits']} stream reuses`\n"
+            f"Extraction: `{resolved} tracks resolved, {per_track} extract calls per track`\n"
+            f"Paths: `{' | '.join(paths) or 'no extractions in the last ' + str(HEALTH_WINDOW // 60) + ' min'}`"
         )
         await ctx.send(report)
 
+    @commands.hybrid_command(name='stalls', description="Shows recent event loop stalls with their stacks.")
+    @commands.has_permissions(administrator=True)
+    @app_commands.describe(count="How many of the latest stalls to show.")
+    async def stalls(self, ctx: commands.Context, count: int = 5):
+        records = self.watchdog.recent(max(1, min(count, self.watchdog.stalls.maxlen)))
+        if not records:
+            return await ctx.send(f"INFO: No event loop stalls over {self.watchdog.threshold * 1000:.0f} ms recorded.")
+
+        summary = f"**EVENT LOOP STALLS** (latest {len(records)}, threshold {self.watchdog.threshold * 1000:.0f} ms)\n"
+        for record in records:
+            block = f"```\n{format_stall(record, frames=4)[:600]}\n```"
+            if len(summary) + len(block) > 1900:
+                break
+            summary += block
+        # Full stacks go in an attachment
+        dump = "\n\n".join(format_stall(record) for record in records)
+        await ctx.send(summary, file=discord.File(io.BytesIO(dump.encode()), filename='stalls.txt'))
+
     @commands.hybrid_command(name='update_ytdlp', description="Updates yt-dlp to the latest version.")
     @commands.has_permissions(administrator=True)
     async def update_ytdlp(self, ctx: commands.Context):
@@ -1093,6 +1902,7 @@ class Music(commands.Cog):
                 import yt_dlp
                 importlib.reload(yt_dlp)
                 new_version = yt_dlp.version.__version__
+                self.environment = await self.bot.loop.run_in_executor(None, probe_environment)
                 await ctx.send(f"SUCCESS: yt-dlp updated to `{new_version}`. Please restart the bot to ensure all changes take effect.")
             else:
                 await ctx.send(f"ERROR: Update failed: {stderr.decode()}")
@@ -1103,6 +1913,14 @@ class Music(commands.Cog):
     async def leave(self, ctx: commands.Context):
         if ctx.voice_client:
             await ctx.voice_client.disconnect()
+        if ctx.guild:
+            player = self.players.pop(ctx.guild.id, None)
+            if player:
+                player.invalidate_prefetch()
+                if player.render_task:
+                    player.render_task.cancel()
+            self.scheduler.cancel(ctx.guild.id, tag='queue')
+            self.cancel_matching(ctx.guild.id)
 
     @commands.hybrid_command(name='help', description="Shows available commands.")
     async def help(self, ctx: commands.Context):
@@ -1134,13 +1952,13 @@ class Music(commands.Cog):
             inline=False
         )
         embed.add_field(
-            name="**!queue / !q**",
-            value="Displays the current song queue.",
+            name="**!queue / !q [page]**",
+            value="Displays the current song queue. `!queue remove <pos>`, `!queue move <from> <to>`, `!queue jump <pos>` edit it.",
             inline=False
         )
         embed.add_field(
             name="**!shuffle**",
-            value="Shuffles the current queue.",
+            value="Toggles shuffle mode (the queue plays in random order).",
             inline=False
         )
         embed.add_field(
@@ -1148,6 +1966,11 @@ class Music(commands.Cog):
             value="Toggles loop mode for the current song.",
             inline=False
         )
+        embed.add_field(
+            name="**!cache**",
+            value="Keeps the current song in the local audio cache.",
+            inline=False
+        )
         embed.add_field(
             name="**!radio [genre]**",
             value="Plays a live radio stream (default: lofi).",
@@ -1173,6 +1996,11 @@ class Music(commands.Cog):
             value="Admin only: Updates yt-dlp to the latest version.",
             inline=False
         )
+        embed.add_field(
+            name="**!stalls [count]**",
+            value="Admin only: Shows recent event loop stalls and where the bot was stuck.",
+            inline=False
+        )
         embed.add_field(
             name="**!leave**",
             value="Disconnects the bot from the voice channel.",
@@ -1,8 +1,13 @@
+import time
+_started = time.perf_counter()
+
 import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
 import asyncio
+import hashlib
+import json
 
 # Load environment variables
 load_dotenv()
@@ -13,6 +18,9 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
+# Hash of the last synced slash command tree; sync is skipped while it matches
+COMMAND_HASH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'command_tree.sha256')
+
 class MusicBot(commands.Bot):
     def __init__(self):
         super().__init__(
@@ -21,16 +29,49 @@ class MusicBot(commands.Bot):
             help_command=None,
             case_insensitive=True
         )
+        self.startup_timings = [('imports', time.perf_counter() - _started)]
+        self._phase_started = time.perf_counter()
+
+    def mark_startup(self, phase):
+        """Records how long a startup phase took (since the previous mark)."""
+        now = time.perf_counter()
+        self.startup_timings.append((phase, now - self._phase_started))
+        self._phase_started = now
+
+    def command_tree_hash(self):
+        commands_data = sorted((cmd.to_dict(self.tree) for cmd in self.tree.get_commands()), key=lambda c: c['name'])
+        return hashlib.sha256(json.dumps(commands_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def save_command_tree_hash(self, tree_hash):
+        os.makedirs(os.path.dirname(COMMAND_HASH_PATH), exist_ok=True)
+        with open(COMMAND_HASH_PATH, 'w') as f:
+            f.write(tree_hash)
+
+    async def sync_if_changed(self):
+        """Syncs slash commands globally unless the tree is unchanged since the last sync."""
+        tree_hash = self.command_tree_hash()
+        try:
+            with open(COMMAND_HASH_PATH, 'r') as f:
+                if f.read().strip() == tree_hash:
+                    return False
+        except OSError:
+            pass
+        await self.tree.sync()
+        self.save_command_tree_hash(tree_hash)
+        return True
 
     async def setup_hook(self):
+        self.mark_startup('login')
         # Load extensions (cogs)
         for filename in os.listdir('./cogs'):
             if filename.endswith('.py'):
                 await self.load_extension(f'cogs.{filename[:-3]}')
                 print(f'Loaded extension: {filename[:-3]}')
+                self.mark_startup(f'load {filename[:-3]}')
         
         # Sync slash commands (optional, useful for hybrid commands)
-        await self.tree.sync() 
+        synced = await self.sync_if_changed()
+        self.mark_startup('command sync' if synced else 'command sync (unchanged, skipped)')
 
     async def on_command_error(self, ctx, error):
         """Global error handler."""
@@ -46,6 +87,11 @@ class MusicBot(commands.Bot):
             print(f"Unhandled Error: {error}")
 
     async def on_ready(self):
+        if self.startup_timings is not None:
+            self.mark_startup('gateway ready')
+            report = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_timings)
+            print(f"Startup took {time.perf_counter() - _started:.2f}s ({report})")
+            self.startup_timings = None  # on_ready fires again after reconnects
         print(f'Logged in as {self.user} (ID: {self.user.id})')
         print('------')
         print("Note: Global slash commands may take up to an hour to appear.")
@@ -77,6 +123,7 @@ class MusicBot(commands.Bot):
                 
             elif spec == "global": # Sync globally
                 synced = await self.tree.sync()
+                self.save_command_tree_hash(self.command_tree_hash())
                 await ctx.send(f"SUCCESS: Synced {len(synced)} commands globally (May take 1 hour).")
                 
             elif spec == "^": # Clear
@@ -20,15 +20,17 @@ fi
 echo "   - Cleaning pycache..."
 find /home/discord/Music_bot -name "__pycache__" -type d -exec rm -rf {} + 2>/dev/null
 
-# 3. Clean up Music Cache (Keep files for 7 days)
-echo "   - Cleaning music cache (older than 7 days)..."
+# 3. Clean up abandoned partial downloads
+# The bot keeps the music cache within AUDIO_CACHE_MB itself; only leftovers
+# from downloads interrupted by a crash or restart need removing here.
+echo "   - Cleaning partial music cache downloads..."
 # Adjust path if necessary. Assuming standard deployment path.
-CACHE_DIR="/home/discord/Music_bot/data/music_cache"
-if [ -d "$CACHE_DIR" ]; then
-    find "$CACHE_DIR" -type f -mtime +7 -delete
-    echo "     Removed cached files older than 7 days."
+PARTIAL_DIR="/home/discord/Music_bot/data/music_cache/.partial"
+if [ -d "$PARTIAL_DIR" ]; then
+    find "$PARTIAL_DIR" -type f -mmin +60 -delete
+    echo "     Removed partial downloads older than 1 hour."
 else
-    echo "     Cache directory not found (skipping)."
+    echo "     Partial download directory not found (skipping)."
 fi
 
 echo "✅ Cleanup Complete."
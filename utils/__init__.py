@@ -0,0 +1 @@
+"""Support modules for the music cog (caches, storage, scheduling)."""
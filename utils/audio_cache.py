@@ -0,0 +1,204 @@
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import yt_dlp
+
+INDEX_FILE = 'index.json'
+PARTIAL_DIR = '.partial'
+
+# Play counts kept for tracks that aren't cached (yet)
+_MAX_TRACKED_PLAYS = 10000
+
+
+class AudioCache:
+    """Size-bounded cache of downloaded tracks on local disk.
+
+    Tracks become cache candidates once they have been played `hot_plays`
+    times or were flagged hot. Downloads land in a partial directory and are
+    moved into place with os.replace(), so a file under its final name is
+    always complete. When the byte budget is exceeded, the least recently
+    played files are evicted. The index is a single JSON file read at
+    startup; the directory itself is never walked.
+    """
+
+    def __init__(self, directory, *, max_bytes, hot_plays=2, max_duration=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hot_plays = hot_plays
+        self.max_duration = max_duration
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # track_id -> {file, size, last_used, plays}; oldest first
+        self._plays = OrderedDict()    # track_id -> play count, for uncached tracks
+        self._hot = set()
+        self._downloading = set()
+        self._dirty = False
+        self._total_bytes = 0  # Kept in step with _entries so stats never touch the disk
+
+        os.makedirs(os.path.join(directory, PARTIAL_DIR), exist_ok=True)
+        self._load_index()
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def stats(self):
+        """Size, age and hit-rate figures, computed without touching the disk."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            last_used = [entry.get('last_used', 0) for entry in self._entries.values()]
+            return {
+                'bytes': self._total_bytes,
+                'files': len(self._entries),
+                'max_bytes': self.max_bytes,
+                # Entries are kept in last-used order
+                'oldest': last_used[0] if last_used else None,
+                'newest': last_used[-1] if last_used else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _load_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            with open(path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        entries = sorted(index.get('entries', {}).items(), key=lambda item: item[1].get('last_used', 0))
+        self._entries = OrderedDict(entries)
+        self._total_bytes = sum(entry.get('size', 0) for _, entry in entries)
+        self._plays = OrderedDict(index.get('plays', {}))
+        self._hot = set(index.get('hot', []))
+
+    def _save_index(self):
+        # Called with self._lock held
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'entries': self._entries, 'plays': self._plays, 'hot': sorted(self._hot)}, f)
+        os.replace(tmp_path, path)
+        self._dirty = False
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def path_for(self, track_id):
+        """Returns the local file for a track, or None if it isn't cached."""
+        with self._lock:
+            entry = self._entries.get(track_id) if track_id else None
+            if entry is None:
+                self.misses += 1
+                return None
+            path = os.path.join(self.directory, entry['file'])
+            if not os.path.exists(path):
+                # Removed behind our back
+                del self._entries[track_id]
+                self._total_bytes -= entry['size']
+                self._dirty = True
+                self.misses += 1
+                return None
+            entry['last_used'] = time.time()
+            self._entries.move_to_end(track_id)
+            self._dirty = True
+            self.hits += 1
+            return path
+
+    def record_play(self, track_id, *, duration=None, is_live=False):
+        """Counts a play and returns True if the track should be downloaded now."""
+        if not track_id or is_live or (duration and duration > self.max_duration):
+            return False
+        with self._lock:
+            entry = self._entries.get(track_id)
+            if entry is not None:
+                entry['plays'] = entry.get('plays', 0) + 1
+                self._dirty = True
+                return False
+            plays = self._plays.pop(track_id, 0) + 1
+            self._plays[track_id] = plays
+            while len(self._plays) > _MAX_TRACKED_PLAYS:
+                self._plays.popitem(last=False)
+            self._dirty = True
+            if track_id in self._downloading:
+                return False
+            if plays >= self.hot_plays or track_id in self._hot:
+                self._downloading.add(track_id)
+                return True
+            return False
+
+    def mark_hot(self, track_id):
+        """Flags a track so it is downloaded on its next play. Returns True if it isn't cached yet."""
+        with self._lock:
+            self._hot.add(track_id)
+            self._dirty = True
+            if track_id in self._entries or track_id in self._downloading:
+                return False
+            self._downloading.add(track_id)
+            return True
+
+    def download(self, track_id, url, ytdl_options):
+        """Downloads url into the cache (blocking). Returns the final path or None."""
+        partial_dir = os.path.join(self.directory, PARTIAL_DIR)
+        safe_id = track_id.replace(':', '_')
+        try:
+            options = dict(ytdl_options)
+            options.update({
+                'outtmpl': os.path.join(partial_dir, f'{safe_id}.%(ext)s'),
+                'noplaylist': True,
+                'extract_flat': False,
+                'format': 'bestaudio/best',
+            })
+            with yt_dlp.YoutubeDL(options) as ydl:
+                info = ydl.extract_info(url, download=True)
+                partial_path = ydl.prepare_filename(info)
+            if not os.path.exists(partial_path):
+                return None
+            return self._commit(track_id, partial_path)
+        except Exception as e:
+            print(f"WARNING: Audio cache download failed for {track_id}: {e}")
+            for leftover in glob.glob(os.path.join(partial_dir, f'{glob.escape(safe_id)}.*')):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+            return None
+        finally:
+            with self._lock:
+                self._downloading.discard(track_id)
+
+    def _commit(self, track_id, partial_path):
+        filename = os.path.basename(partial_path)
+        final_path = os.path.join(self.directory, filename)
+        os.replace(partial_path, final_path)
+        size = os.path.getsize(final_path)
+        with self._lock:
+            plays = self._plays.pop(track_id, 0)
+            replaced = self._entries.get(track_id)
+            if replaced:
+                self._total_bytes -= replaced['size']
+            self._total_bytes += size
+            self._entries[track_id] = {'file': filename, 'size': size, 'last_used': time.time(), 'plays': plays}
+            self._entries.move_to_end(track_id)
+            self._evict()
+            self._save_index()
+        print(f"DEBUG: Cached {track_id} locally ({size / (1024 * 1024):.1f} MB)")
+        return final_path
+
+    def _evict(self):
+        # Called with self._lock held; oldest entries are first in the dict
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            track_id, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry['size']
+            self._hot.discard(track_id)
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except OSError:
+                pass
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+
+MAX_SAMPLES = 500  # per path, whatever the window
+
+
+class _Breaker:
+    __slots__ = ('opened', 'open_until', 'cooldown', 'trial_at')
+
+    def __init__(self, cooldown):
+        self.opened = False
+        self.open_until = 0.0
+        self.cooldown = cooldown
+        self.trial_at = None  # When the half-open trial was handed out
+
+
+class HealthTracker:
+    """Success rate and latency of each extraction path, with circuit breakers.
+
+    A path is any name a caller records outcomes under: a source
+    ('youtube', 'bilibili') or one way of reaching it ('youtube:tv').
+    Only outcomes from the last `window` seconds count, so the picture
+    follows the sites within minutes. Once at least `min_samples` recent
+    attempts on a path have failed at `failure_threshold` or worse, its
+    breaker opens and rank() leaves it out for `cooldown` seconds. After
+    that, one request is let through as a trial: success closes the
+    breaker with a clean slate, failure keeps it open for twice as long
+    (up to `max_cooldown`).
+    """
+
+    def __init__(self, *, window=300, min_samples=4, failure_threshold=0.5, cooldown=60, max_cooldown=900,
+                 default_latency=2.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.default_latency = default_latency  # Assumed for paths with no successes yet
+        self._samples = {}   # path -> deque[(monotonic time, ok, seconds)]
+        self._breakers = {}  # path -> _Breaker
+        self._lock = threading.Lock()
+
+    def _window(self, path, now):
+        samples = self._samples.get(path)
+        if samples is None:
+            samples = self._samples[path] = deque(maxlen=MAX_SAMPLES)
+        cutoff = now - self.window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return samples
+
+    def _breaker(self, path):
+        breaker = self._breakers.get(path)
+        if breaker is None:
+            breaker = self._breakers[path] = _Breaker(self.cooldown)
+        return breaker
+
+    def _state(self, path, now):
+        breaker = self._breakers.get(path)
+        if breaker is None or not breaker.opened:
+            return 'closed'
+        return 'open' if now < breaker.open_until else 'half-open'
+
+    def _cost(self, path, now):
+        # Expected seconds to a working result: success latency over smoothed success rate
+        samples = self._window(path, now)
+        ok_seconds = [seconds for _, ok, seconds in samples if ok]
+        rate = (len(ok_seconds) + 1) / (len(samples) + 2)
+        latency = sum(ok_seconds) / len(ok_seconds) if ok_seconds else self.default_latency
+        return latency / rate
+
+    def record(self, path, ok, seconds):
+        """Records one attempt on path that took `seconds`."""
+        now = time.monotonic()
+        with self._lock:
+            samples = self._window(path, now)
+            breaker = self._breaker(path)
+            breaker.trial_at = None
+            samples.append((now, ok, seconds))
+            if ok:
+                if breaker.opened:
+                    # It works again; old failures no longer say anything
+                    print(f"INFO: Extraction path {path} recovered.")
+                    breaker.opened = False
+                    breaker.cooldown = self.cooldown
+                    samples.clear()
+                    samples.append((now, ok, seconds))
+                return
+            if breaker.opened:
+                if now >= breaker.open_until:
+                    breaker.cooldown = min(breaker.cooldown * 2, self.max_cooldown)
+                    breaker.open_until = now + breaker.cooldown
+                return
+            failures = sum(1 for _, ok, _ in samples if not ok)
+            if len(samples) >= self.min_samples and failures / len(samples) >= self.failure_threshold:
+                breaker.opened = True
+                breaker.open_until = now + breaker.cooldown
+                print(f"WARNING: Extraction path {path} failed {failures} of {len(samples)} times recently; "
+                      f"skipping it for {breaker.cooldown:.0f}s.")
+
+    def is_open(self, path):
+        """True while path's breaker is open and its cooldown hasn't run out."""
+        with self._lock:
+            return self._state(path, time.monotonic()) == 'open'
+
+    def rank(self, paths, *, probe=True):
+        """Orders paths healthiest first, leaving out those whose breaker is open.
+
+        With probe set, one path whose cooldown is over goes first as its
+        trial (the caller must record() or release() it). If every path is
+        open, all of them are returned anyway, best first, as a last resort.
+        """
+        now = time.monotonic()
+        trial, healthy, blocked = [], [], []
+        with self._lock:
+            for path in paths:
+                state = self._state(path, now)
+                breaker = self._breakers.get(path)
+                if state == 'closed':
+                    healthy.append(path)
+                elif (state == 'half-open' and probe and not trial
+                      and (breaker.trial_at is None or now - breaker.trial_at > breaker.cooldown)):
+                    breaker.trial_at = now
+                    trial.append(path)
+                else:
+                    blocked.append(path)
+            # sort() is stable: paths nobody knows anything about keep the caller's order
+            healthy.sort(key=lambda path: self._cost(path, now))
+            blocked.sort(key=lambda path: self._cost(path, now))
+        return trial + healthy if trial or healthy else blocked
+
+    def release(self, path):
+        """Hands back a trial from rank() that ended without an outcome worth recording."""
+        with self._lock:
+            breaker = self._breakers.get(path)
+            if breaker is not None:
+                breaker.trial_at = None
+
+    def snapshot(self):
+        """Returns {path: {'state', 'attempts', 'success_rate', 'latency'}} over the current window."""
+        now = time.monotonic()
+        report = {}
+        with self._lock:
+            for path in sorted(self._samples):
+                samples = self._window(path, now)
+                ok_seconds = [seconds for _, ok, seconds in samples if ok]
+                report[path] = {
+                    'state': self._state(path, now),
+                    'attempts': len(samples),
+                    'success_rate': len(ok_seconds) / len(samples) if samples else None,
+                    'latency': sum(ok_seconds) / len(ok_seconds) if ok_seconds else None,
+                }
+        return report
@@ -0,0 +1,244 @@
+import asyncio
+import bisect
+import threading
+
+from aiohttp import web
+
+# Latency buckets (seconds) shared by the extraction and playback histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + body + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple -> value
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((values, (list(s[0]), s[1], s[2])) for values, s in self._values.items())
+        lines = self.header()
+        for values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = (('le', _format_value(float(bound))),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format.
+
+    Collectors are callables run at scrape time that return
+    [(name, documentation, [(labels_dict, value), ...])] families (gauges
+    unless a fourth item names the type), for figures that already live
+    elsewhere (queue lengths, cache stats) and so cost nothing to keep up
+    to date.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"WARNING: Metrics collector {collector!r} failed: {e}")
+                continue
+            for name, documentation, samples, *kind in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind[0] if kind else 'gauge'}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+async def monitor_loop_lag(gauge, histogram, interval=0.5):
+    """Measures how late the event loop wakes up from a sleep, forever."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        gauge.set(lag)
+        histogram.observe(lag)
+
+
+class MetricsServer:
+    """Serves a Registry at http://host:port/metrics."""
+
+    def __init__(self, registry, *, host='127.0.0.1', port=9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Prometheus-Format': '0.0.4'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# --- Instruments used by the bot ---
+
+REGISTRY = Registry()
+
+EXTRACT_SECONDS = REGISTRY.histogram(
+    'musicbot_extract_seconds', "Time spent in yt-dlp extraction per resolved track.", ('source',))
+EXTRACTIONS = REGISTRY.counter(
+    'musicbot_extractions_total', "Tracks resolved through yt-dlp, by outcome.", ('source', 'outcome'))
+EXTRACT_CALLS = REGISTRY.counter(
+    'musicbot_extract_calls_total', "extract_info calls made while resolving tracks.", ('source',))
+DEEP_EXTRACTIONS = REGISTRY.counter(
+    'musicbot_deep_extractions_total', "Resolutions that followed a flat search hit with a second extract_info call.",
+    ('source',))
+TIME_TO_FIRST_AUDIO = REGISTRY.histogram(
+    'musicbot_time_to_first_audio_seconds', "From play_next picking a track to audio starting.", ('prefetched',))
+TRACKS_STARTED = REGISTRY.counter(
+    'musicbot_tracks_started_total', "Tracks handed to the voice client.", ('source',))
+BILI_FALLBACKS = REGISTRY.counter(
+    'musicbot_bili_fallbacks_total', "YouTube failures retried on Bilibili, by outcome.", ('outcome',))
+HEDGES = REGISTRY.counter(
+    'musicbot_hedged_resolutions_total', "Slow or failing YouTube resolutions raced against Bilibili, by winner.",
+    ('winner',))
+FFMPEG_SPAWNS = REGISTRY.counter(
+    'musicbot_ffmpeg_spawns_total', "FFmpeg processes started, by audio path.", ('mode',))
+FFMPEG_ERRORS = REGISTRY.counter(
+    'musicbot_ffmpeg_errors_total', "Playback errors reported by the voice client.")
+LOOP_LAG = REGISTRY.gauge(
+    'musicbot_event_loop_lag_seconds', "Most recent event loop wake-up delay.")
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    'musicbot_event_loop_lag_distribution_seconds', "Event loop wake-up delay.", buckets=LAG_BUCKETS)
+LOOP_STALLS = REGISTRY.counter(
+    'musicbot_event_loop_stalls_total', "Event loop stalls caught by the watchdog.")
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+class _Box:
+    __slots__ = ('channel', 'pending', 'task', 'holds', 'held_since')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.pending = OrderedDict()  # key -> content, in posting order
+        self.task = None
+        self.holds = 0
+        self.held_since = 0.0
+
+
+class Outbox:
+    """Per-channel queue for the bot's background status messages.
+
+    post() doesn't send right away: everything posted to a channel within
+    `window` seconds goes out as one message, and a post whose key matches
+    a still-unsent one replaces it. While a channel is held (a command is
+    running there), its queued messages wait for up to `max_hold` seconds,
+    so the replies users are waiting for get the channel's rate limit first.
+    """
+
+    def __init__(self, *, window=1.5, max_hold=5.0):
+        self.window = window
+        self.max_hold = max_hold
+        self._boxes = {}  # channel id -> _Box
+
+    def _box(self, channel):
+        box = self._boxes.get(channel.id)
+        if box is None:
+            box = self._boxes[channel.id] = _Box(channel)
+        return box
+
+    def post(self, channel, content, *, key=None):
+        """Queues content for channel, replacing any unsent post with the same key."""
+        box = self._box(channel)
+        box.channel = channel
+        if key is None:
+            key = object()
+        else:
+            box.pending.pop(key, None)  # The replacement goes to the end
+        box.pending[key] = content
+        if box.task is None:
+            box.task = asyncio.ensure_future(self._drain(box))
+
+    def discard(self, channel, key):
+        """Drops an unsent post, e.g. a progress note that is already outdated."""
+        box = self._boxes.get(channel.id)
+        if box is not None:
+            box.pending.pop(key, None)
+
+    def hold(self, channel):
+        box = self._box(channel)
+        if box.holds == 0:
+            box.held_since = time.monotonic()
+        box.holds += 1
+
+    def release(self, channel):
+        box = self._boxes.get(channel.id)
+        if box is None:
+            return
+        box.holds = max(0, box.holds - 1)
+        if box.holds == 0 and box.task is None and not box.pending:
+            del self._boxes[channel.id]
+
+    async def _drain(self, box):
+        try:
+            await asyncio.sleep(self.window)
+            while box.holds and time.monotonic() - box.held_since < self.max_hold:
+                await asyncio.sleep(0.25)
+            lines = list(box.pending.values())
+            box.pending.clear()
+            for chunk in _chunks(lines):
+                try:
+                    await box.channel.send(chunk)
+                except Exception as e:
+                    print(f"Warning: Could not send message to channel {box.channel.id}: {e}")
+                    break
+        except asyncio.CancelledError:
+            box.pending.clear()
+            raise
+        finally:
+            box.task = None
+            if box.pending:
+                box.task = asyncio.ensure_future(self._drain(box))
+            elif box.holds == 0 and self._boxes.get(box.channel.id) is box:
+                del self._boxes[box.channel.id]
+
+    def close(self):
+        for box in self._boxes.values():
+            if box.task:
+                box.task.cancel()
+        self._boxes.clear()
+
+
+def _chunks(lines):
+    """Joins lines into as few messages as fit Discord's length limit."""
+    chunk = ''
+    for line in lines:
+        line = line[:MAX_MESSAGE_LENGTH]
+        if chunk and len(chunk) + 1 + len(line) > MAX_MESSAGE_LENGTH:
+            yield chunk
+            chunk = line
+        else:
+            chunk = f"{chunk}\n{line}" if chunk else line
+    if chunk:
+        yield chunk
@@ -0,0 +1,186 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+
+class PlaylistStore:
+    """Saved playlists in a SQLite database.
+
+    Songs are rows keyed by (playlist, position), so appending never
+    rewrites the playlist, removal touches one row, and pages and searches
+    are answered by the database instead of loading the whole list.
+    Positions only grow; a song's 1-based index is its rank among the
+    remaining rows. All methods are blocking.
+    """
+
+    def __init__(self, path, legacy_dir=None):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS playlists ("
+            "id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, next_pos INTEGER NOT NULL DEFAULT 0, "
+            "size INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS songs ("
+            "playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE, "
+            "pos INTEGER NOT NULL, query TEXT NOT NULL, PRIMARY KEY (playlist_id, pos)) WITHOUT ROWID"
+        )
+        self._db.commit()
+        if legacy_dir:
+            self._migrate_json(legacy_dir)
+
+    def _migrate_json(self, legacy_dir):
+        """Imports data/playlists/<name>.json files left by older versions."""
+        for filepath in sorted(glob.glob(os.path.join(glob.escape(legacy_dir), '*.json'))):
+            name = os.path.basename(filepath)[:-5]
+            try:
+                with open(filepath, 'r') as f:
+                    tracks = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"WARNING: Could not migrate playlist {filepath}: {e}")
+                continue
+            queries = [str(t) for t in tracks]
+            # One transaction, so a crash midway leaves the file to be imported again
+            with self._lock:
+                try:
+                    playlist_id = self._db.execute("INSERT INTO playlists (name) VALUES (?)", (name,)).lastrowid
+                except sqlite3.IntegrityError:
+                    playlist_id = None  # A playlist by that name already exists; keep it
+                try:
+                    if playlist_id is not None:
+                        self._db.executemany(
+                            "INSERT INTO songs (playlist_id, pos, query) VALUES (?, ?, ?)",
+                            [(playlist_id, i, query) for i, query in enumerate(queries)],
+                        )
+                        self._db.execute("UPDATE playlists SET next_pos = ?, size = ? WHERE id = ?",
+                                         (len(queries), len(queries), playlist_id))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._db.rollback()
+                    print(f"WARNING: Could not migrate playlist {filepath}: {e}")
+                    continue
+            if playlist_id is not None:
+                print(f"Migrated playlist '{name}' ({len(queries)} songs) to {self.path}")
+            os.replace(filepath, filepath + '.migrated')
+
+    def _playlist(self, name):
+        # Called with self._lock held
+        return self._db.execute("SELECT id, next_pos, size FROM playlists WHERE name = ?", (name,)).fetchone()
+
+    def names(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT name FROM playlists ORDER BY name")]
+
+    def search_names(self, fragment, limit=25):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name FROM playlists WHERE instr(lower(name), lower(?)) > 0 ORDER BY name LIMIT ?",
+                (fragment, limit),
+            )
+            return [row[0] for row in rows]
+
+    def exists(self, name):
+        with self._lock:
+            return self._playlist(name) is not None
+
+    def size(self, name):
+        """Number of songs in a playlist, or None if it doesn't exist."""
+        with self._lock:
+            row = self._playlist(name)
+        return row[2] if row else None
+
+    def create(self, name):
+        """Creates an empty playlist. Returns False if the name is taken."""
+        with self._lock:
+            try:
+                self._db.execute("INSERT INTO playlists (name) VALUES (?)", (name,))
+            except sqlite3.IntegrityError:
+                return False
+            self._db.commit()
+            return True
+
+    def delete(self, name):
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM playlists WHERE name = ?", (name,)).rowcount
+            self._db.commit()
+            return deleted > 0
+
+    def append(self, name, queries):
+        """Appends songs to the end of a playlist. Returns the new size, or None if it doesn't exist."""
+        with self._lock:
+            row = self._playlist(name)
+            if row is None:
+                return None
+            playlist_id, next_pos, size = row
+            self._db.executemany(
+                "INSERT INTO songs (playlist_id, pos, query) VALUES (?, ?, ?)",
+                [(playlist_id, next_pos + i, query) for i, query in enumerate(queries)],
+            )
+            self._db.execute(
+                "UPDATE playlists SET next_pos = ?, size = ? WHERE id = ?",
+                (next_pos + len(queries), size + len(queries), playlist_id),
+            )
+            self._db.commit()
+            return size + len(queries)
+
+    def page(self, name, offset=0, limit=25):
+        """Returns [(index, query)] for a slice of a playlist, 1-based."""
+        with self._lock:
+            row = self._playlist(name)
+            if row is None:
+                return []
+            rows = self._db.execute(
+                "SELECT query FROM songs WHERE playlist_id = ? ORDER BY pos LIMIT ? OFFSET ?",
+                (row[0], limit, offset),
+            ).fetchall()
+        return [(offset + i + 1, r[0]) for i, r in enumerate(rows)]
+
+    def songs(self, name):
+        """Returns every song in a playlist, in order."""
+        with self._lock:
+            row = self._playlist(name)
+            if row is None:
+                return []
+            rows = self._db.execute("SELECT query FROM songs WHERE playlist_id = ? ORDER BY pos", (row[0],))
+            return [r[0] for r in rows]
+
+    def remove_at(self, name, index):
+        """Removes the song at a 1-based index. Returns it, or None if out of range."""
+        with self._lock:
+            row = self._playlist(name)
+            if row is None or index < 1 or index > row[2]:
+                return None
+            playlist_id = row[0]
+            pos, query = self._db.execute(
+                "SELECT pos, query FROM songs WHERE playlist_id = ? ORDER BY pos LIMIT 1 OFFSET ?",
+                (playlist_id, index - 1),
+            ).fetchone()
+            self._db.execute("DELETE FROM songs WHERE playlist_id = ? AND pos = ?", (playlist_id, pos))
+            self._db.execute("UPDATE playlists SET size = size - 1 WHERE id = ?", (playlist_id,))
+            self._db.commit()
+            return query
+
+    def search(self, name, fragment, limit=25):
+        """Returns [(index, query)] for songs whose text or index matches fragment."""
+        with self._lock:
+            row = self._playlist(name)
+            if row is None:
+                return []
+            rows = self._db.execute(
+                "SELECT idx, query FROM ("
+                "  SELECT ROW_NUMBER() OVER (ORDER BY pos) AS idx, query FROM songs WHERE playlist_id = ?"
+                ") WHERE instr(lower(query), lower(?)) > 0 OR CAST(idx AS TEXT) LIKE ? || '%' LIMIT ?",
+                (row[0], fragment, fragment, limit),
+            )
+            return [(r[0], r[1]) for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
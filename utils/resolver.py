@@ -0,0 +1,333 @@
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import yt_dlp
+
+# Fields of an extract_info() result the player needs once a track is resolved
+TRACK_FIELDS = ('id', 'title', 'duration', 'thumbnail', 'webpage_url', 'url', 'is_live', 'http_headers', 'extractor_key')
+
+
+def _is_unresolved(data):
+    """True for a flat search/playlist hit (an ID and a link, no formats yet)."""
+    if data.get('_type') in ('url', 'url_transparent'):
+        return True
+    return not data.get('formats') and not data.get('url')
+
+
+def _followup_url(data):
+    """The page a flat entry points at, rebuilt from its ID if the link is missing."""
+    url = data.get('url') or data.get('webpage_url')
+    if not url and data.get('id') and data.get('ie_key', 'Youtube') == 'Youtube':
+        url = f"https://www.youtube.com/watch?v={data['id']}"
+    return url
+
+
+def _audio_rank(fmt):
+    # googlevideo URLs first, then bitrate
+    return ('.googlevideo.com' in fmt['url'], fmt.get('abr') or 0)
+
+
+def select_audio_format(formats):
+    """Picks the best audio format in one pass, or None.
+
+    Audio-only formats win over progressive (audio+video) ones; within each
+    group googlevideo URLs are preferred, then the highest bitrate, and the
+    first of equals is kept. Storyboards (mhtml) and formats without a URL
+    never qualify.
+    """
+    best_audio = best_progressive = None
+    audio_rank = progressive_rank = None
+    for fmt in formats:
+        if not fmt.get('url') or fmt.get('acodec') == 'none' or fmt.get('ext') == 'mhtml':
+            continue
+        rank = _audio_rank(fmt)
+        if fmt.get('vcodec') == 'none':
+            if best_audio is None or rank > audio_rank:
+                best_audio, audio_rank = fmt, rank
+        elif best_audio is None and (best_progressive is None or rank > progressive_rank):
+            best_progressive, progressive_rank = fmt, rank
+    return best_audio or best_progressive
+
+
+def extract_stream_info(ytdl_instance, url, stream=True):
+    """Runs yt-dlp on url and picks the best audio stream (blocking).
+
+    A search or playlist link gives a flat entry (extract_flat is
+    'in_playlist'), which is followed up with exactly one extraction of that
+    video, straight through its extractor. Anything else is resolved by the
+    first call. The chosen URL is stored under data['stream_url'], and the
+    number of extract_info calls it took under data['extract_calls'] (or
+    under e.extract_calls on the exception when it fails).
+    """
+    extract_calls = 1
+    try:
+        try:
+            data = ytdl_instance.extract_info(url, download=not stream)
+        except Exception as e:
+            err_msg = str(e).strip().split('\n')[-1]
+            print(f"ERROR: Failed to extract info for {url}: {err_msg}")
+            raise e
+
+        if data and 'entries' in data:
+            # take first item from a search or playlist
+            data = next((entry for entry in data['entries'] if entry), None)
+            if data is None:
+                raise Exception("No search results found.")
+
+        if data and _is_unresolved(data):
+            target = _followup_url(data)
+            if not target:
+                raise Exception("No playable formats found.")
+            print(f"DEBUG: Resolving search hit: {target}")
+            extract_calls += 1
+            data = ytdl_instance.extract_info(target, download=not stream, ie_key=data.get('ie_key'))
+
+        if not data or ('formats' not in data and stream):
+             raise Exception("No playable formats found. This might be due to YouTube signature challenges or IP blocking.")
+
+        # Ensure we have a title
+        if 'title' not in data:
+            data['title'] = "Unknown Title"
+
+        stream_format = select_audio_format(data.get('formats') or [])
+        filename = stream_format['url'] if stream_format else data.get('url')
+        if not filename:
+             raise Exception("Failed to resolve a direct stream URL.")
+    except Exception as e:
+        e.extract_calls = extract_calls
+        raise
+
+    print(f"DEBUG: Resolved Title: {data.get('title')} ({extract_calls} extract call{'s' if extract_calls > 1 else ''})")
+    print(f"DEBUG: Final Stream URL: {filename[:100]}...")
+    data['stream_url'] = filename
+    data['extract_calls'] = extract_calls
+    if stream_format:
+        data['stream_format'] = {k: stream_format.get(k) for k in ('format_id', 'ext', 'acodec', 'abr')}
+    return data
+
+
+# Errors about the video itself: no other player client will get past them
+_VIDEO_GONE_MARKERS = ('video unavailable', 'private video', 'has been removed', 'account associated with this video',
+                       'not available in your country', 'members-only', 'copyright claim')
+# Errors about who is asking (bot checks, rate limits), which another client may avoid
+_CLIENT_TROUBLE_MARKERS = ('sign in to confirm', 'not a bot', 'http error 429', 'too many requests', 'rate-limit')
+
+
+def is_final_error(error):
+    """True for yt-dlp errors that are final for this video, whichever client asks.
+
+    yt-dlp marks them with ExtractorError.expected (DownloadError wraps the
+    ExtractorError in exc_info). Its bot checks are "expected" too, but
+    those are about the client, so they never count as final.
+    """
+    final = getattr(error, 'final', None)  # Decided in a worker process, see _worker_resolve()
+    if final is not None:
+        return final
+    message = str(error).lower()
+    if any(marker in message for marker in _CLIENT_TROUBLE_MARKERS):
+        return False
+    if any(marker in message for marker in _VIDEO_GONE_MARKERS):
+        return True
+    exc_info = getattr(error, 'exc_info', None)
+    cause = exc_info[1] if exc_info else error
+    return isinstance(cause, yt_dlp.utils.ExtractorError) and cause.expected
+
+
+def compact_info(data):
+    """Strips a resolved info dict down to what the player and caches use."""
+    compact = {k: data[k] for k in TRACK_FIELDS if data.get(k) is not None}
+    for key in ('stream_url', 'stream_format', 'extract_calls'):
+        if data.get(key):
+            compact[key] = data[key]
+    return compact
+
+
+# --- Worker process side ---
+
+class WorkerExtractionError(Exception):
+    """A yt-dlp error raised in a worker process, flattened to its message.
+
+    yt-dlp exceptions carry loggers and tracebacks that can't be pickled
+    back to the parent.
+    """
+
+_worker_instances = {}
+
+
+def _init_worker(option_sets):
+    # Suppress noise from youtube_dl, as in the main process
+    yt_dlp.utils.bug_reports_message = lambda *args, **kwargs: ''
+    for name, options in option_sets.items():
+        _worker_instances[name] = yt_dlp.YoutubeDL(options)
+
+
+def _worker_ping():
+    return True
+
+
+def _worker_resolve(name, url, stream):
+    try:
+        return compact_info(extract_stream_info(_worker_instances[name], url, stream))
+    except Exception as e:
+        error = WorkerExtractionError(str(e))
+        # The original exception doesn't survive the trip back; send what the router needs
+        error.extract_calls = getattr(e, 'extract_calls', 1)
+        error.final = is_final_error(e)
+        raise error from None
+
+
+def _worker_extract(name, url, kwargs):
+    ydl = _worker_instances[name]
+    try:
+        return ydl.sanitize_info(ydl.extract_info(url, **kwargs))
+    except Exception as e:
+        raise WorkerExtractionError(str(e)) from None
+
+
+class ProcessResolver:
+    """A pool of warm worker processes that each hold preconfigured YoutubeDL instances.
+
+    Running extraction there keeps node signature solving, JSON parsing and
+    format sorting off the GIL shared with the event loop and the voice
+    send threads. Workers are replaced after max_jobs jobs to bound memory
+    growth.
+    """
+
+    def __init__(self, option_sets, *, workers=2, max_jobs=100):
+        self.option_sets = option_sets
+        self.workers = max(1, workers)
+        self.max_jobs = max(1, max_jobs)
+        self._lock = threading.Lock()
+        self._jobs = 0
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        kwargs = {}
+        if sys.version_info >= (3, 11):
+            kwargs['max_tasks_per_child'] = self.max_jobs
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.option_sets,),
+            **kwargs,
+        )
+        # Start every worker now so the first tracks don't pay for the spawn
+        for _ in range(self.workers):
+            pool.submit(_worker_ping)
+        return pool
+
+    def _replace_pool(self, old):
+        with self._lock:
+            if self._pool is old:
+                old.shutdown(wait=False)
+                self._pool = self._new_pool()
+                self._jobs = 0
+
+    def call(self, fn, *args):
+        """Runs fn(*args) in a worker and blocks until it returns."""
+        with self._lock:
+            self._jobs += 1
+            pool = self._pool
+        if sys.version_info < (3, 11) and self._jobs >= self.workers * self.max_jobs:
+            # No per-worker recycling before 3.11; replace the whole pool instead
+            self._replace_pool(pool)
+            pool = self._pool
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault in a native lib); start fresh ones for the next job
+            print("WARNING: Resolver worker process died, restarting the pool.")
+            self._replace_pool(pool)
+            raise
+
+    def extractor(self, name):
+        """Returns a YoutubeDL stand-in that runs the named option set in the pool."""
+        return PooledExtractor(self, name)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class PooledExtractor:
+    """Blocking YoutubeDL look-alike backed by a ProcessResolver."""
+
+    def __init__(self, resolver, name):
+        self.resolver = resolver
+        self.name = name
+
+    def resolve_stream(self, url, stream=True):
+        return self.resolver.call(_worker_resolve, self.name, url, stream)
+
+    def extract_info(self, url, **kwargs):
+        return self.resolver.call(_worker_extract, self.name, url, kwargs)
+
+
+class RoutedExtractor:
+    """YoutubeDL look-alike that reaches one source through several paths, healthiest first.
+
+    `paths` maps a path name (e.g. 'youtube:tv', one per player client) to
+    a callable returning that path's extractor, so each is built on first
+    use. resolve_stream() tries them in HealthTracker.rank() order and moves
+    on when one fails. A path's failure is only held against it when a later
+    path worked for the same URL; when they all fail it's the video or the
+    whole source that is down, which is recorded against the source. Errors
+    about the video itself (is_final_error()) end the attempt at once and
+    count against nobody.
+    """
+
+    def __init__(self, health, source, paths):
+        self.health = health
+        self.source = source
+        self.paths = paths
+
+    def resolve_stream(self, url, stream=True):
+        order = self.health.rank(list(self.paths))
+        if len(order) > 1 and self.health.is_open(self.source):
+            # The whole source is failing; one probe is enough
+            for path in order[1:]:
+                self.health.release(path)
+            order = order[:1]
+        started = time.perf_counter()
+        failed = []
+        extract_calls = 0  # Including those spent on paths that failed
+        error = None
+        for i, path in enumerate(order):
+            attempt_started = time.perf_counter()
+            ytdl = self.paths[path]()
+            try:
+                resolve_stream = getattr(ytdl, 'resolve_stream', None)
+                data = resolve_stream(url, stream) if resolve_stream else extract_stream_info(ytdl, url, stream)
+            except Exception as e:
+                extract_calls += getattr(e, 'extract_calls', 1)
+                if is_final_error(e):
+                    for path in [failed_path for failed_path, _ in failed] + order[i:]:
+                        self.health.release(path)
+                    e.extract_calls = extract_calls
+                    raise
+                failed.append((path, time.perf_counter() - attempt_started))
+                error = e
+                continue
+            for failed_path, seconds in failed:
+                self.health.record(failed_path, False, seconds)
+            self.health.record(path, True, time.perf_counter() - attempt_started)
+            if path != self.source:
+                self.health.record(self.source, True, time.perf_counter() - started)
+            data['extract_calls'] = extract_calls + data.get('extract_calls', 1)
+            data['extract_path'] = path
+            return data
+
+        for failed_path, _ in failed:
+            self.health.release(failed_path)
+        self.health.record(self.source, False, time.perf_counter() - started)
+        error.extract_calls = extract_calls
+        raise error
+
+    def extract_info(self, url, **kwargs):
+        # Searches, playlists and metadata: one attempt on the healthiest path
+        path = self.health.rank(list(self.paths), probe=False)[0]
+        return self.paths[path]().extract_info(url, **kwargs)
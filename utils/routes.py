@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+import time
+
+from utils.lru import LRUCache
+from utils.track_cache import canonical_track_id
+
+
+class RouteTable:
+    """Remembers queue entries that only play from Bilibili.
+
+    When YouTube fails for an entry and a Bilibili stand-in plays instead,
+    the entry (its canonical track ID for URLs, normalized text for
+    searches) is recorded with the stand-in's URL, so the next time it is
+    queued it goes there directly. Routes expire after `max_age` seconds,
+    in case YouTube recovers, and are dropped as soon as the stand-in
+    itself stops working.
+    """
+
+    def __init__(self, path, *, max_memory=4096, max_age=7 * 86400):
+        self.path = path
+        self.max_age = max_age
+        self._memory = LRUCache(maxsize=max_memory)  # query -> (url, routed_at), or ('', 0) for no route
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS routes ("
+            "query TEXT PRIMARY KEY, source TEXT NOT NULL, url TEXT NOT NULL, routed_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _key(query):
+        # Video IDs are case-sensitive; only search text is folded
+        return canonical_track_id(query) or ' '.join(query.lower().split())
+
+    def get(self, query):
+        """Returns the URL a queue entry is routed to, or None."""
+        key = self._key(query)
+        route = self._memory.get(key)
+        if route is None:
+            with self._lock:
+                row = self._db.execute("SELECT url, routed_at FROM routes WHERE query = ?", (key,)).fetchone()
+            route = tuple(row) if row else ('', 0)
+            self._memory.set(key, route)
+        url, routed_at = route
+        if url and routed_at < time.time() - self.max_age:
+            self.forget(query)
+            return None
+        return url or None
+
+    def record(self, query, source, url):
+        """Routes a queue entry to url, which played from `source` after the usual path failed."""
+        key = self._key(query)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO routes (query, source, url, routed_at) VALUES (?, ?, ?, ?)",
+                (key, source, url, now),
+            )
+            self._db.commit()
+        self._memory.set(key, (url, now))
+
+    def forget(self, query):
+        """Drops the route of a queue entry, e.g. after the stand-in failed too."""
+        key = self._key(query)
+        self._memory.set(key, ('', 0))
+        with self._lock:
+            self._db.execute("DELETE FROM routes WHERE query = ?", (key,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
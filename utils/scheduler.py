@@ -0,0 +1,125 @@
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Lower runs first
+PRIORITY_HEDGE = -1     # A backup lookup racing a stalled one; may use the reserved workers
+PRIORITY_PLAYBACK = 0   # Someone is waiting for audio right now
+PRIORITY_PREFETCH = 1   # Next track in a queue
+PRIORITY_BULK = 2       # Playlist imports and other batch work
+_LEVELS = (PRIORITY_HEDGE, PRIORITY_PLAYBACK, PRIORITY_PREFETCH, PRIORITY_BULK)
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'guild_id', 'tag', 'future')
+
+    def __init__(self, fn, args, guild_id, tag, future):
+        self.fn = fn
+        self.args = args
+        self.guild_id = guild_id
+        self.tag = tag
+        self.future = future
+
+
+class ExtractionScheduler:
+    """Runs blocking yt-dlp work on its own bounded thread pool.
+
+    Jobs wait in one queue per priority level. Within a level each guild has
+    its own FIFO and guilds take turns, so one guild importing a huge
+    playlist only ever holds a fair share of the workers. Cancelling the
+    awaiting coroutine (or calling cancel()) drops a job that hasn't started.
+
+    `reserved` extra workers only take PRIORITY_HEDGE jobs, so a backup
+    lookup still starts while stalled jobs it is racing hold every
+    regular worker.
+    """
+
+    def __init__(self, workers=4, reserved=0):
+        self.workers = max(1, workers)
+        self.reserved = max(0, reserved)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers + self.reserved, thread_name_prefix='extract')
+        self._levels = {level: OrderedDict() for level in _LEVELS}  # level -> guild_id -> deque[_Job]
+        self._running = 0
+
+    def pending(self, guild_id=None):
+        """Number of queued (not yet running) jobs, optionally for one guild."""
+        total = 0
+        for guilds in self._levels.values():
+            if guild_id is None:
+                total += sum(len(jobs) for jobs in guilds.values())
+            elif guild_id in guilds:
+                total += len(guilds[guild_id])
+        return total
+
+    async def run(self, fn, *args, guild_id=None, priority=PRIORITY_PLAYBACK, tag=None):
+        """Queues fn(*args) and returns its result once a worker has run it."""
+        loop = asyncio.get_running_loop()
+        job = _Job(fn, args, guild_id, tag, loop.create_future())
+        self._levels[priority].setdefault(guild_id, deque()).append(job)
+        self._dispatch()
+        return await job.future
+
+    def cancel(self, guild_id, tag=None):
+        """Drops queued jobs for a guild (only those with `tag` if given)."""
+        dropped = 0
+        for guilds in self._levels.values():
+            jobs = guilds.get(guild_id)
+            if not jobs:
+                continue
+            keep = deque()
+            for job in jobs:
+                if tag is None or job.tag == tag:
+                    job.future.cancel()
+                    dropped += 1
+                else:
+                    keep.append(job)
+            if keep:
+                guilds[guild_id] = keep
+            else:
+                del guilds[guild_id]
+        return dropped
+
+    def _next_job(self, levels):
+        for level in levels:
+            guilds = self._levels[level]
+            while guilds:
+                guild_id, jobs = next(iter(guilds.items()))
+                job = jobs.popleft()
+                # Rotate so the next pick at this level goes to another guild
+                del guilds[guild_id]
+                if jobs:
+                    guilds[guild_id] = jobs
+                if not job.future.done():
+                    return job
+        return None
+
+    def _dispatch(self):
+        while self._running < self.workers + self.reserved:
+            # Past the regular workers, only hedge jobs may start
+            job = self._next_job(_LEVELS if self._running < self.workers else (PRIORITY_HEDGE,))
+            if job is None:
+                return
+            self._running += 1
+            work = asyncio.get_running_loop().run_in_executor(self._executor, job.fn, *job.args)
+            work.add_done_callback(lambda w, job=job: self._finished(job, w))
+
+    def _finished(self, job, work):
+        self._running -= 1
+        if not job.future.done():
+            if work.cancelled():
+                job.future.cancel()
+            elif work.exception() is not None:
+                job.future.set_exception(work.exception())
+            else:
+                job.future.set_result(work.result())
+        elif not work.cancelled():
+            work.exception()  # Nobody is waiting; don't warn about it
+        self._dispatch()
+
+    def shutdown(self):
+        for guilds in self._levels.values():
+            for jobs in guilds.values():
+                for job in jobs:
+                    job.future.cancel()
+            guilds.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from spotipy.exceptions import SpotifyException
+from urllib3.util.retry import Retry
+
+from utils.lru import LRUCache
+
+_SPOTIFY_URL_RE = re.compile(r'(?:open\.spotify\.com/(?:intl-[\w-]+/)?|spotify:)(track|album|playlist)[/:]([A-Za-z0-9]+)')
+
+PLAYLIST_PAGE = 100  # Spotify's maximum page sizes
+ALBUM_PAGE = 50
+_PLAYLIST_FIELDS = 'items(track(id,name,artists(name),is_local)),total'
+
+
+def spotify_session():
+    """A requests session for spotipy that retries server errors but hands every 429 back.
+
+    spotipy's default session lets urllib3 honour Retry-After, which sleeps
+    inside an executor thread; SpotifyCatalog waits out 429s on the loop.
+    """
+    retry = Retry(total=3, connect=None, read=False, status=3, backoff_factor=0.3,
+                  allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                  status_forcelist=(500, 502, 503, 504), respect_retry_after_header=False)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def parse_spotify_url(url):
+    """Returns (kind, id) for a Spotify track/album/playlist link, or None."""
+    match = _SPOTIFY_URL_RE.search(url)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def track_query(track):
+    """The "Artist - Title" search query a Spotify track is queued as."""
+    artists = track.get('artists') or [{}]
+    return f"{artists[0].get('name', '')} - {track.get('name', '')}"
+
+
+class SpotifyCatalog:
+    """Loads Spotify tracks, albums and playlists off the event loop.
+
+    Every page of a collection is fetched (the first one tells us how many
+    there are, the rest run concurrently) and stream() yields them in order
+    as soon as each is available. 429 responses are retried after the
+    server's Retry-After. Results are kept in a SQLite file: playlists under
+    their snapshot_id, albums and single tracks forever. A playlist whose
+    snapshot was checked less than `fresh_for` seconds ago is served without
+    any API call; after that one small request confirms the snapshot.
+    """
+
+    def __init__(self, client, path, *, concurrency=4, max_retries=5, fresh_for=600):
+        self.client = client
+        self.path = path
+        self.max_retries = max_retries
+        self.fresh_for = fresh_for
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS collections ("
+            "key TEXT PRIMARY KEY, snapshot_id TEXT, tracks TEXT NOT NULL, checked_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS tracks (id TEXT PRIMARY KEY, query TEXT NOT NULL)")
+        self._db.commit()
+
+    def _load(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT snapshot_id, tracks, checked_at FROM collections WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'snapshot_id': row[0], 'tracks': [tuple(t) for t in json.loads(row[1])], 'checked_at': row[2]}
+
+    def _save(self, key, snapshot_id, tracks):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO collections (key, snapshot_id, tracks, checked_at) VALUES (?, ?, ?, ?)",
+                (key, snapshot_id, json.dumps(tracks), time.time()),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tracks (id, query) VALUES (?, ?)", [t for t in tracks if t[0]]
+            )
+            self._db.commit()
+
+    def _touch(self, key):
+        with self._lock:
+            self._db.execute("UPDATE collections SET checked_at = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+
+    def _save_track(self, track_id, query):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO tracks (id, query) VALUES (?, ?)", (track_id, query))
+            self._db.commit()
+
+    def _cached_track(self, track_id):
+        with self._lock:
+            row = self._db.execute("SELECT query FROM tracks WHERE id = ?", (track_id,)).fetchone()
+        return row[0] if row else None
+
+    async def _call(self, fn, *args, **kwargs):
+        """Runs a blocking spotipy call in a thread, backing off on rate limits."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                try:
+                    return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+                except SpotifyException as e:
+                    if e.http_status != 429 or attempt == self.max_retries:
+                        raise
+                    headers = e.headers or {}
+                    try:
+                        delay = float(headers.get('Retry-After', 0)) or 2 ** attempt
+                    except ValueError:
+                        delay = 2 ** attempt
+            print(f"Spotify rate limited, retrying in {delay:.0f}s")
+            await asyncio.sleep(min(delay, 60))
+
+    async def _pages(self, first, fetch_page, page_size, parse):
+        """Yields parsed pages in order; pages after the first are fetched concurrently."""
+        yield parse(first)
+        total = first.get('total') or 0
+        offsets = range(page_size, total, page_size)
+        pending = [asyncio.ensure_future(fetch_page(offset)) for offset in offsets]
+        try:
+            for task in pending:
+                yield parse(await task)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, url):
+        """Yields lists of (spotify_id, query) for a Spotify link, in order.
+
+        Raises ValueError for links that aren't a track, album or playlist.
+        """
+        parsed = parse_spotify_url(url)
+        if parsed is None:
+            raise ValueError("Unsupported Spotify link.")
+        kind, spotify_id = parsed
+        loop = asyncio.get_running_loop()
+
+        if kind == 'track':
+            query = await loop.run_in_executor(None, self._cached_track, spotify_id)
+            if query is None:
+                track = await self._call(self.client.track, spotify_id)
+                query = track_query(track)
+                await loop.run_in_executor(None, self._save_track, spotify_id, query)
+            yield [(spotify_id, query)]
+            return
+
+        key = f'{kind}:{spotify_id}'
+        cached = await loop.run_in_executor(None, self._load, key)
+        snapshot_id = None
+        if kind == 'album':
+            if cached:
+                yield cached['tracks']
+                return
+
+            def parse(page):
+                return [(item.get('id'), track_query(item)) for item in page.get('items') or []]
+
+            def fetch_page(offset):
+                return self._call(self.client.album_tracks, spotify_id, limit=ALBUM_PAGE, offset=offset)
+            page_size = ALBUM_PAGE
+        else:
+            if cached and cached['checked_at'] > time.time() - self.fresh_for:
+                yield cached['tracks']
+                return
+            meta = await self._call(self.client.playlist, spotify_id, fields='snapshot_id')
+            snapshot_id = meta.get('snapshot_id')
+            if cached and snapshot_id and cached['snapshot_id'] == snapshot_id:
+                await loop.run_in_executor(None, self._touch, key)
+                yield cached['tracks']
+                return
+
+            def parse(page):
+                tracks = []
+                for item in page.get('items') or []:
+                    track = item.get('track')
+                    if track and track.get('name') and not track.get('is_local'):
+                        tracks.append((track.get('id'), track_query(track)))
+                return tracks
+
+            def fetch_page(offset):
+                return self._call(self.client.playlist_items, spotify_id, fields=_PLAYLIST_FIELDS,
+                                  limit=PLAYLIST_PAGE, offset=offset, additional_types=('track',))
+            page_size = PLAYLIST_PAGE
+
+        tracks = []
+        async for page in self._pages(await fetch_page(0), fetch_page, page_size, parse):
+            tracks.extend(page)
+            yield page
+        await loop.run_in_executor(None, self._save, key, snapshot_id, tracks)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class MatchTable:
+    """Remembers which video a Spotify track ("Artist - Title") plays as.
+
+    Rows are keyed by the normalized query text, which is what the queue and
+    saved playlists hold, and also record the Spotify track ID when known.
+    A query that found nothing is remembered as a failure and isn't searched
+    again until `retry_failed_after` seconds have passed.
+    """
+
+    def __init__(self, path, *, max_memory=4096, retry_failed_after=86400):
+        self.path = path
+        self.retry_failed_after = retry_failed_after
+        self._memory = LRUCache(maxsize=max_memory)  # query -> url, or '' for a remembered failure
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            "query TEXT PRIMARY KEY, spotify_id TEXT, url TEXT, checked_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS matches_spotify_id ON matches (spotify_id)")
+        self._db.commit()
+
+    @staticmethod
+    def _key(query):
+        return ' '.join(query.lower().split())
+
+    def get(self, query):
+        """Returns the matched video URL for a query, or None."""
+        key = self._key(query)
+        url = self._memory.get(key)
+        if url is None:
+            with self._lock:
+                row = self._db.execute("SELECT url FROM matches WHERE query = ?", (key,)).fetchone()
+            url = (row[0] or '') if row else None
+            if url is not None:
+                self._memory.set(key, url)
+        return url or None
+
+    def unmatched(self, tracks):
+        """Filters [(spotify_id, query)] down to the tracks that still need a search."""
+        keys = {self._key(query) for _, query in tracks}
+        retry_before = time.time() - self.retry_failed_after
+        known = set()
+        with self._lock:
+            keys_list = list(keys)
+            for i in range(0, len(keys_list), 500):
+                chunk = keys_list[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT query FROM matches WHERE query IN ({','.join('?' * len(chunk))}) "
+                    "AND (url IS NOT NULL OR checked_at > ?)",
+                    (*chunk, retry_before),
+                )
+                known.update(row[0] for row in rows)
+        todo, seen = [], set()
+        for spotify_id, query in tracks:
+            key = self._key(query)
+            if key not in known and key not in seen:
+                seen.add(key)
+                todo.append((spotify_id, query))
+        return todo
+
+    def record(self, results):
+        """Stores [(spotify_id, query, url_or_None)] search outcomes."""
+        now = time.time()
+        rows = [(self._key(query), spotify_id, url, now) for spotify_id, query, url in results]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO matches (query, spotify_id, url, checked_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+        for key, _, url, _ in rows:
+            self._memory.set(key, url or '')
+
+    def forget(self, query):
+        """Drops a match that turned out not to play."""
+        key = self._key(query)
+        self._memory.pop(key)
+        with self._lock:
+            self._db.execute("DELETE FROM matches WHERE query = ?", (key,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import aiohttp
+
+from utils.lru import LRUCache
+
+SUGGEST_URL = "https://suggestqueries.google.com/complete/search"
+
+# The suggest endpoint never returns more than this many entries, so a
+# shorter list is known to be complete for its prefix
+_FULL_PAGE = 10
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class SuggestionClient:
+    """YouTube search suggestions for /play autocomplete.
+
+    Uses one pooled HTTP session, caches results per normalized prefix and
+    answers longer prefixes from a cached shorter one when that is exact
+    enough. Each user has at most one request in flight: a newer keystroke
+    cancels the older one while it is still in its debounce delay or on the
+    wire. suggest() never takes longer than `budget` seconds; past that it
+    answers from the cache (or with nothing) and lets the request finish in
+    the background to warm the cache.
+    """
+
+    def __init__(self, *, cache_size=4096, ttl=900, debounce=0.15, budget=2.0, min_reuse=5):
+        self.debounce = debounce
+        self.budget = budget
+        self.min_reuse = min_reuse
+        self._cache = LRUCache(maxsize=cache_size, ttl=ttl)
+        self._session = None
+        self._pending = {}  # requester key -> asyncio.Task
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=16, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=5),
+            )
+        return self._session
+
+    async def close(self):
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def cached(self, prefix, *, strict=True):
+        """Returns suggestions for prefix from the cache, or None.
+
+        With strict=False any shorter cached prefix is used, even when its
+        filtered result may be missing entries.
+        """
+        hit = self._cache.get(prefix)
+        if hit is not None:
+            return hit
+        for end in range(len(prefix) - 1, 0, -1):
+            shorter = self._cache.get(prefix[:end])
+            if shorter is None:
+                continue
+            narrowed = [s for s in shorter if s.lower().startswith(prefix)]
+            if not strict or len(shorter) < _FULL_PAGE or len(narrowed) >= self.min_reuse:
+                return narrowed
+            return None
+        return None
+
+    async def _fetch(self, prefix):
+        await asyncio.sleep(self.debounce)
+        params = {'client': 'firefox', 'ds': 'yt', 'q': prefix}
+        async with self._get_session().get(SUGGEST_URL, params=params) as response:
+            if response.status != 200:
+                return []
+            data = json.loads(await response.text())
+        suggestions = [s for s in data[1] if isinstance(s, str)][:25]
+        self._cache.set(prefix, suggestions)
+        return suggestions
+
+    async def suggest(self, key, query):
+        """Returns up to 25 suggestions for query typed by the requester `key`."""
+        prefix = normalize_query(query)
+        if not prefix:
+            return []
+
+        hit = self.cached(prefix)
+        if hit is not None:
+            return hit
+
+        stale = self._pending.pop(key, None)
+        if stale:
+            stale.cancel()
+        task = asyncio.ensure_future(self._fetch(prefix))
+        self._pending[key] = task
+
+        def _done(t):
+            if self._pending.get(key) is t:
+                del self._pending[key]
+            if not t.cancelled():
+                t.exception()  # Mark as retrieved; failures just mean no suggestions
+        task.add_done_callback(_done)
+
+        done, _ = await asyncio.wait({task}, timeout=self.budget)
+        if task in done and not task.cancelled() and task.exception() is None:
+            return task.result()
+        return self.cached(prefix, strict=False) or []
@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse as urlparse
+
+from utils.lru import LRUCache
+from utils.resolver import TRACK_FIELDS
+
+_YT_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?.*?v=|shorts/|embed/|live/)|youtu\.be/)([\w-]{11})')
+_BILI_ID_RE = re.compile(r'bilibili\.com/video/(BV\w{10}|av\d+)', re.IGNORECASE)
+
+
+def canonical_track_id(url):
+    """Returns a stable 'source:id' key for a track URL, or None if it isn't one."""
+    if not url:
+        return None
+    match = _YT_ID_RE.search(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    match = _BILI_ID_RE.search(url)
+    if match:
+        return f"bilibili:{match.group(1)}"
+    return None
+
+
+def stream_url_expiry(stream_url, default_ttl):
+    """Returns when a signed stream URL stops being usable (unix time)."""
+    now = time.time()
+    expires_at = now + default_ttl
+    try:
+        params = urlparse.parse_qs(urlparse.urlparse(stream_url).query)
+        # googlevideo uses expire=, Bilibili's CDN uses deadline=
+        signed = params.get('expire') or params.get('deadline')
+        if signed:
+            # Keep a margin so a track doesn't expire halfway through playback
+            expires_at = min(expires_at, int(signed[0]) - 600)
+    except (ValueError, TypeError):
+        pass
+    return expires_at
+
+
+class TrackCache:
+    """Caches extracted track metadata by canonical track ID.
+
+    An in-memory LRU sits in front of a SQLite file under data/. Search
+    queries are stored as aliases pointing at the track they resolved to, so
+    re-queuing "artist - title" finds the same entry as the video URL.
+    Metadata expires after max_age seconds; the stream URL inside an entry
+    has its own, much shorter lifetime.
+    """
+
+    def __init__(self, path, *, max_memory=1024, max_entries=20000, max_age=7 * 86400, stream_ttl=3 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.stream_ttl = stream_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stream_hits = 0
+        self._memory = LRUCache(maxsize=max_memory)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, cached_at REAL NOT NULL, stream_expires REAL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, id TEXT NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS tracks_cached_at ON tracks (cached_at)")
+        self._db.commit()
+
+    @staticmethod
+    def _alias(query):
+        return ' '.join(query.lower().split())
+
+    def _resolve_key(self, query):
+        track_id = canonical_track_id(query)
+        if track_id:
+            return track_id
+        alias = self._alias(query)
+        track_id = self._memory.get(('alias', alias))
+        if track_id:
+            return track_id
+        with self._lock:
+            row = self._db.execute("SELECT id FROM aliases WHERE alias = ?", (alias,)).fetchone()
+        if row:
+            self._memory.set(('alias', alias), row[0])
+            return row[0]
+        return None
+
+    def _load(self, track_id):
+        entry = self._memory.get(track_id)
+        if entry is None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT data, cached_at, stream_expires FROM tracks WHERE id = ?", (track_id,)
+                ).fetchone()
+            if row is None:
+                return None
+            entry = {'data': json.loads(row[0]), 'cached_at': row[1], 'stream_expires': row[2]}
+            self._memory.set(track_id, entry)
+
+        if entry['cached_at'] < time.time() - self.max_age:
+            self._memory.pop(track_id)
+            with self._lock:
+                self._db.execute("DELETE FROM tracks WHERE id = ?", (track_id,))
+                self._db.commit()
+            return None
+        return entry
+
+    def lookup(self, query):
+        """Returns cached metadata for a URL or search query, or None.
+
+        The returned dict never contains a stream URL; use lookup_stream()
+        when the caller wants to skip extraction entirely.
+        """
+        track_id = self._resolve_key(query)
+        entry = self._load(track_id) if track_id else None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        data = dict(entry['data'])
+        data.pop('stream_url', None)
+        return data
+
+    def lookup_stream(self, query):
+        """Returns cached metadata including a still-valid stream URL, or None."""
+        track_id = self._resolve_key(query)
+        entry = self._load(track_id) if track_id else None
+        if entry is None or not entry['stream_expires'] or entry['stream_expires'] <= time.time():
+            return None
+        self.stream_hits += 1
+        return dict(entry['data'])
+
+    def store(self, query, data):
+        """Stores the metadata of a resolved track and remembers query as an alias."""
+        track_id = canonical_track_id(data.get('webpage_url') or '') or canonical_track_id(query)
+        if not track_id:
+            return None
+
+        record = {k: data[k] for k in TRACK_FIELDS if data.get(k) is not None}
+        stream_expires = None
+        if data.get('stream_url') and not data.get('is_live'):
+            record['stream_url'] = data['stream_url']
+            record['stream_format'] = data.get('stream_format')
+            stream_expires = stream_url_expiry(data['stream_url'], self.stream_ttl)
+
+        now = time.time()
+        old = self._load(track_id)
+        if old and not stream_expires and old['stream_expires'] and old['stream_expires'] > now:
+            # Metadata-only refresh; keep the still-valid stream URL
+            record['stream_url'] = old['data'].get('stream_url')
+            record['stream_format'] = old['data'].get('stream_format')
+            stream_expires = old['stream_expires']
+
+        self._memory.set(track_id, {'data': record, 'cached_at': now, 'stream_expires': stream_expires})
+        aliases = [] if canonical_track_id(query) else [self._alias(query)]
+        for alias in aliases:
+            self._memory.set(('alias', alias), track_id)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tracks (id, data, cached_at, stream_expires) VALUES (?, ?, ?, ?)",
+                (track_id, json.dumps(record), now, stream_expires),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO aliases (alias, id) VALUES (?, ?)", [(a, track_id) for a in aliases]
+            )
+            self._db.commit()
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune()
+        return track_id
+
+    def invalidate_stream(self, query):
+        """Forgets the stream URL of a track, e.g. after ffmpeg got a 403 on it."""
+        track_id = self._resolve_key(query)
+        if not track_id:
+            return
+        self._memory.pop(track_id)
+        with self._lock:
+            self._db.execute("UPDATE tracks SET stream_expires = NULL WHERE id = ?", (track_id,))
+            self._db.commit()
+
+    def _prune(self):
+        # Called with self._lock held
+        cutoff = time.time() - self.max_age
+        self._db.execute("DELETE FROM tracks WHERE cached_at < ?", (cutoff,))
+        self._db.execute(
+            "DELETE FROM tracks WHERE id NOT IN (SELECT id FROM tracks ORDER BY cached_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._db.execute("DELETE FROM aliases WHERE id NOT IN (SELECT id FROM tracks)")
+        self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stream_hits': self.stream_hits,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,257 @@
+import random
+
+
+class _Node:
+    __slots__ = ('entry', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+
+    def update(self):
+        self.size = 1 + (self.left.size if self.left else 0) + (self.right.size if self.right else 0)
+
+
+def _size(node):
+    return node.size if node else 0
+
+
+def _split(node, count):
+    """Splits a tree into (first `count` entries, the rest)."""
+    if node is None:
+        return None, None
+    left_size = _size(node.left)
+    if count <= left_size:
+        first, node.left = _split(node.left, count)
+        node.update()
+        return first, node
+    node.right, rest = _split(node.right, count - left_size - 1)
+    node.update()
+    return node, rest
+
+
+def _merge(first, second):
+    """Joins two trees, every entry of `first` coming before `second`."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    if first.priority > second.priority:
+        first.right = _merge(first.right, second)
+        first.update()
+        return first
+    second.left = _merge(first, second.left)
+    second.update()
+    return second
+
+
+def _build(entries):
+    """Builds a tree from entries in order in O(n) (a Cartesian tree over random priorities)."""
+    stack = []
+    for entry in entries:
+        node = _Node(entry)
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+            last.update()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    # Nodes still on the stack form the right spine; fix their sizes bottom-up
+    for node in reversed(stack):
+        node.update()
+    return stack[0] if stack else None
+
+
+class TrackQueue:
+    """The play queue: (query, requester_id) entries, indexed by position.
+
+    Backed by an implicit treap (a randomized balanced tree ordered by
+    position), so inserting, removing or moving an entry anywhere costs
+    O(log n), a page of k entries costs O(log n + k), and appending a whole
+    playlist costs O(k). The deque methods the player uses (append,
+    appendleft, popleft, [0], len, iteration) work as before. Counts per
+    requester are kept up to date alongside.
+    """
+
+    def __init__(self, entries=()):
+        self._root = None
+        self._requesters = {}  # requester_id -> number of queued entries
+        self.extend(entries)
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __bool__(self):
+        return self._root is not None
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def __repr__(self):
+        return f"TrackQueue({len(self)} entries)"
+
+    def _position(self, index):
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('queue index out of range')
+        return index
+
+    def __getitem__(self, index):
+        index = self._position(index)
+        node = self._root
+        while True:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.entry
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def _count(self, entry, delta):
+        requester = entry[1]
+        count = self._requesters.get(requester, 0) + delta
+        if count:
+            self._requesters[requester] = count
+        else:
+            self._requesters.pop(requester, None)
+
+    # --- Adding ---
+
+    def insert(self, index, entry):
+        """Inserts entry so it ends up at index (clamped to the queue, like list.insert)."""
+        size = len(self)
+        if index < 0:
+            index = max(0, index + size)
+        first, rest = _split(self._root, min(index, size))
+        self._root = _merge(_merge(first, _Node(entry)), rest)
+        self._count(entry, 1)
+
+    def append(self, entry):
+        self._root = _merge(self._root, _Node(entry))
+        self._count(entry, 1)
+
+    def appendleft(self, entry):
+        self._root = _merge(_Node(entry), self._root)
+        self._count(entry, 1)
+
+    def extend(self, entries):
+        entries = list(entries)
+        if not entries:
+            return
+        self._root = _merge(self._root, _build(entries))
+        for entry in entries:
+            self._count(entry, 1)
+
+    # --- Removing ---
+
+    def popleft(self):
+        if self._root is None:
+            raise IndexError('pop from an empty queue')
+        # Walk the left spine, shrinking each subtree on the way, and unlink the first node
+        parent, node = None, self._root
+        while node.left is not None:
+            node.size -= 1
+            parent, node = node, node.left
+        if parent is None:
+            self._root = node.right
+        else:
+            parent.left = node.right
+        self._count(node.entry, -1)
+        return node.entry
+
+    def pop(self, index=-1):
+        """Removes and returns the entry at index."""
+        index = self._position(index)
+        first, rest = _split(self._root, index)
+        node, rest = _split(rest, 1)
+        self._root = _merge(first, rest)
+        self._count(node.entry, -1)
+        return node.entry
+
+    def move(self, source, destination):
+        """Moves the entry at source so it ends up at destination. Returns it."""
+        destination = self._position(destination)
+        entry = self.pop(source)
+        self.insert(destination, entry)
+        return entry
+
+    def drop_front(self, count):
+        """Removes the first `count` entries and returns how many were removed."""
+        count = max(0, min(count, len(self)))
+        dropped, self._root = _split(self._root, count)
+        if dropped is not None:
+            for entry in self._walk(dropped):
+                self._count(entry, -1)
+        return count
+
+    def clear(self):
+        self._root = None
+        self._requesters.clear()
+
+    # --- Reading ---
+
+    @staticmethod
+    def _walk(node):
+        stack = []
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.entry
+            node = node.right
+
+    def iter_from(self, start):
+        """Iterates entries from index start onwards; getting there costs O(log n)."""
+        if start >= len(self):
+            return
+        start = max(0, start)
+        # Ancestors still to visit after the subtree we descend into
+        stack = []
+        node = self._root
+        while node is not None:
+            left_size = _size(node.left)
+            if start < left_size:
+                stack.append(node)
+                node = node.left
+            elif start == left_size:
+                stack.append(node)
+                break
+            else:
+                start -= left_size + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.entry
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def page(self, start, count):
+        """Returns up to `count` entries starting at index start."""
+        entries = []
+        if count <= 0:
+            return entries
+        for entry in self.iter_from(start):
+            entries.append(entry)
+            if len(entries) == count:
+                break
+        return entries
+
+    def count_by(self, requester_id):
+        """Number of queued entries added by requester_id."""
+        return self._requesters.get(requester_id, 0)
+
+    def requester_counts(self):
+        """Returns {requester_id: queued entries}."""
+        return dict(self._requesters)
@@ -0,0 +1,132 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+
+
+class LoopWatchdog:
+    """Detects event loop stalls and records what the loop was stuck on.
+
+    A coroutine on the loop stamps a heartbeat every `interval` seconds; a
+    daemon thread checks the stamp. When the heartbeat is `threshold`
+    seconds overdue, the thread grabs the loop thread's current stack via
+    sys._current_frames() along with the running task and whatever label
+    was attached to it (e.g. the command and guild). Stalls are kept in a
+    ring buffer of `capacity` entries; each one's final duration is filled
+    in once the loop gets going again.
+    """
+
+    def __init__(self, *, threshold=0.5, interval=0.1, capacity=50, on_stall=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.on_stall = on_stall  # Called (from the watchdog thread) with each new record
+        self.stalls = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._labels = weakref.WeakKeyDictionary()  # asyncio.Task -> label
+        self._loop = None
+        self._loop_thread_id = None
+        self._beat = time.monotonic()
+        self._open = None  # Record of the stall in progress
+        self._heartbeat_task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts watching the running loop. Must be called from the loop's thread."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    def label_current_task(self, label):
+        """Attaches label to the running task, so stalls inside it say what it was doing."""
+        task = asyncio.current_task()
+        if task is not None:
+            self._labels[task] = label
+
+    def clear_current_task(self):
+        task = asyncio.current_task()
+        if task is not None:
+            self._labels.pop(task, None)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                if self._open is not None:
+                    self._open['duration'] = now - self._open['_last_beat'] - self.interval
+                    del self._open['_last_beat']
+                    self._open = None
+                self._beat = now
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            with self._lock:
+                last_beat = self._beat
+                overdue = time.monotonic() - last_beat - self.interval
+                if overdue < self.threshold or self._open is not None:
+                    continue
+                record = self._capture(last_beat, overdue)
+                self._open = record
+                self.stalls.append(record)
+            if self.on_stall:
+                try:
+                    self.on_stall(record)
+                except Exception as e:
+                    print(f"WARNING: Stall callback failed: {e}")
+
+    def _capture(self, last_beat, overdue):
+        # Called with self._lock held, from the watchdog thread
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        task = None
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            pass
+        label = self._labels.get(task) if task is not None else None
+        return {
+            'at': time.time(),
+            'duration': None,  # Filled in when the loop recovers
+            'overdue': overdue,
+            'task': task.get_name() if task is not None else None,
+            'coro': repr(task.get_coro()) if task is not None else None,
+            'context': label,
+            'stack': stack,
+            '_last_beat': last_beat,
+        }
+
+    def recent(self, count=None):
+        """Returns the latest stalls, newest first."""
+        with self._lock:
+            records = list(self.stalls)
+        records.reverse()
+        return records[:count] if count else records
+
+
+def format_stall(record, *, frames=None):
+    """Renders a stall record as text; frames limits the stack to its innermost entries."""
+    when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['at']))
+    duration = record['duration']
+    length = f"{duration:.2f}s" if duration is not None else f">{record['overdue']:.2f}s (ongoing)"
+    lines = [f"[{when}] loop blocked {length}"]
+    if record['context']:
+        lines.append(f"  context: {record['context']}")
+    if record['task']:
+        lines.append(f"  task: {record['task']} {record['coro']}")
+    stack = record['stack'][-frames:] if frames else record['stack']
+    lines.extend(line.rstrip('\n') for line in stack)
+    return '\n'.join(lines)